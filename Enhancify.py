@@ -1,45 +1,22 @@
-
-from distutils.log import warn
-from src.Enhancify_sequential import Enhancify
+from src.enhance import enhanceGroup
+from src.Enhancify_sequential import runOptions
+from src.metrics import aggregateMetrics
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import getopt
 import sys
 import glob
 import os
 import time
+import json
+import shlex
+import shutil
 import subprocess
 import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 
 
-# MPI version of Enhancify. It requires both MPI and mpi4py.
-
-def runMPI(folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, cores, verbose):
-    try:
-        # Using mpiexec
-        run = "mpiexec -np %d python src/Enhancify_mpi.py %s %s %d %d %s %f %f %d %d %s" % (cores, folderIn, folderOut,
-                                                                                        population, generations, selection,
-                                                                                        cross_rate, mut_rate, pressure,
-                                                                                        elitism, str(verbose))
-
-        # Calling the MPI version of Enhancify, which distributes the computation onto multiple cores
-        # by means of a Master-Slave paradigm
-        p = subprocess.call(run, shell=True)
-    except:
-        # Using mpirun
-        run = "mpirun -np %d python src/Enhancify_mpi.py %s %s %d %d %s %f %f %d %d %s" % (cores, folderIn, folderOut,
-                                                                                       population, generations, selection,
-                                                                                       cross_rate, mut_rate, pressure,
-                                                                                       elitism, str(verbose))
-
-        # Calling the MPI version of Enhancify, which is based on the sequential version
-        p = subprocess.call(run, shell=True)
-
-# Sequential version of Enhancify
-
-
-def run(imagePath, folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, verbose):
-
-    startAll = time.time()
+# Looking for the images to be processed (either the provided image or the images in the provided folder)
+def collectImages(imagePath, folderIn):
 
     toProcess = []
 
@@ -94,6 +71,122 @@ def run(imagePath, folderIn, folderOut, population, generations, selection, cros
             else:
                 toProcess.append(imagePath)
 
+    return toProcess
+
+# Output folder of an image
+def outputFolder(folderOut, imagePath):
+
+    string = imagePath.split("/")[1:]
+    subfolder = string[-1].split(".")[:-1]
+
+    pathOutput = folderOut+os.sep+subfolder[0]
+
+    if not os.path.exists(pathOutput):
+        os.makedirs(pathOutput)
+
+    return pathOutput
+
+def printSettings(version, population, generations, selection, cross_rate, mut_rate, pressure, elitism, options):
+
+    print( "******************************************************************************************")
+    print( "* Running the %s version of Enhancify\n" % version)
+
+    print( " * GA settings")
+    print( "   -> Number of chromosome: %d" % population)
+    print( "   -> Number of elite chromosomes: %d" % elitism)
+    print( "   -> Number of generations: %d" % generations)
+    print( "   -> Crossover rate: %.2f" % cross_rate)
+    print( "   -> Mutation rate:  %.2f" % mut_rate)
+    print( "   -> Fitness cache size: %d" % options["cacheSize"])
+    print( "   -> Seed: %s" % options["seed"])
+    print( "   -> Fitness workers: %d" % options["fitnessWorkers"])
+    if options["islands"] > 1:
+        print( "   -> Islands: %d (%s topology), %d migrants every %d generations" % (options["islands"], options["topology"],
+                                                                                   options["migrants"], options["migrationInterval"]))
+
+    if selection == 'wheel':
+        print( "   -> Selection: wheel roulette\n\n")
+    elif selection == 'ranking':
+        print( "   -> Selection: ranking \n\n")
+    else:
+        print( "   -> Selection: tournament with %d individuals\n\n" % pressure)
+
+# Groups of images processed by a single GA run (lists of indices): the images with the same histogram are grouped together
+# when dedup is True, otherwise each image is a group
+def imageGroups(toProcess, options, dedup):
+
+    if not dedup or len(toProcess) < 2:
+        return [[i] for i in range(len(toProcess))]
+
+    from src.imageProcessing import processing
+    return processing().groupByHistogram(toProcess, options["histogramCache"])
+
+# Enhancify execution on a group of images with the same histogram by using the provided GA settings
+# (the outputs are saved into pathsOutput); options contains the options of Enhancify.startGA
+def processGroup(imagePaths, pathsOutput, population, generations, selection, cross_rate, mut_rate, pressure, elitism, options):
+
+    start = time.time()
+
+    result = enhanceGroup(imagePaths, pathsOutput, population, generations, selection,
+                          cross_rate, mut_rate, elitism, pressure, **options)
+
+    elapsed = time.time() - start
+
+    return elapsed, result.cacheStatistics
+
+# Name of a group of images for the verbose output
+def groupName(imagePaths):
+
+    if len(imagePaths) == 1:
+        return imagePaths[0]
+
+    return "%s (and %d images with the same histogram)" % (imagePaths[0], len(imagePaths) - 1)
+
+# MPI version of Enhancify. It requires both MPI and mpi4py.
+# When neither mpiexec nor mpirun are available, the local parallel version is used
+
+def runMPI(folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, cores, verbose, options, dedup):
+
+    launcher = None
+    for command in ["mpiexec", "mpirun"]:
+        if shutil.which(command) is not None:
+            launcher = command
+            break
+
+    if launcher is None:
+        print( "******************************************************************************************")
+        print( " * Warning, neither mpiexec nor mpirun are available. Running with %d local workers" % cores)
+        runLocal(None, folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, verbose, options, cores, dedup)
+        return
+
+    # The ranks run the same interpreter as this process, whatever the working directory
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "Enhancify_mpi.py")
+
+    run = "%s -np %d %s %s %s %s %d %d %s %f %f %d %d %s %s %s" % (launcher, cores, shlex.quote(sys.executable), shlex.quote(script),
+                                                                 shlex.quote(folderIn), shlex.quote(folderOut),
+                                                                 population, generations, selection,
+                                                                 cross_rate, mut_rate, elitism,
+                                                                 pressure, str(verbose), shlex.quote(json.dumps(options)), str(dedup))
+
+    # Calling the MPI version of Enhancify, which distributes the computation onto multiple cores
+    # by means of a Master-Slave paradigm
+    code = subprocess.call(run, shell=True)
+
+    # When the MPI run fails (e.g., mpi4py is not installed), the images are processed by the local parallel version
+    if code != 0:
+        print( "******************************************************************************************")
+        print( " * Warning, the MPI version of Enhancify failed (exit code %d). Running with %d local workers" % (code, cores))
+        runLocal(None, folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, verbose, options, cores, dedup)
+
+# Local parallel version of Enhancify, based on a pool of processes (no MPI required)
+# As in the MPI version, a new image is assigned to each worker as soon as it is free
+
+def runLocal(imagePath, folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, verbose, options, workers, dedup=True):
+
+    startAll = time.time()
+
+    toProcess = collectImages(imagePath, folderIn)
+
     if not os.path.exists(folderOut):
         os.makedirs(folderOut)
 
@@ -102,62 +195,152 @@ def run(imagePath, folderIn, folderOut, population, generations, selection, cros
         exit(-11)
 
     if verbose:
+        printSettings("local parallel", population, generations, selection, cross_rate, mut_rate, pressure, elitism, options)
+        print( " * Enhancify is using %d workers\n\n" % workers)
+
+    pathsOutput = [outputFolder(folderOut, toProcess[i]) for i in range(len(toProcess))]
+
+    # The images with the same histogram are processed by a single GA run
+    groups = imageGroups(toProcess, options, dedup)
+    times = np.zeros(len(groups))
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+        futures = {}
+        for i, group in enumerate(groups):
+            future = executor.submit(processGroup, [toProcess[j] for j in group], [pathsOutput[j] for j in group], population, generations, selection,
+                                     cross_rate, mut_rate, pressure, elitism, options)
+            futures[future] = i
+
+        for future in as_completed(futures):
+            i = futures[future]
+            elapsed, cacheStatistics = future.result()
+            times[i] = elapsed
+
+            if verbose:
+                print( " * Analyzed image %s" % groupName([toProcess[j] for j in groups[i]]))
+                if options["cacheSize"] > 0:
+                    print( "-> Fitness cache: %d hits, %d misses" % cacheStatistics)
+                print( "-> Elapsed time %5.2fs" % (elapsed))
+
+    elapsedAll = time.time() - startAll
+
+    if options["metrics"]:
+        aggregateMetrics(pathsOutput, folderOut)
+
+    if verbose:
+        print( "\n * Total elapsed time %5.2fs" % elapsedAll, "for computing", len(toProcess), "images (%d GA runs)" % len(groups))
+        print( " * Mean elapsed time  %5.2fs per GA run" % np.mean(times))
+        print( " * Throughput %5.2f images/min" % (len(toProcess) * 60.0 / elapsedAll))
         print( "******************************************************************************************")
-        print( "* Running the sequential version of Enhancify\n")
-
-        print( " * GA settings")
-        print( "   -> Number of chromosome: %d" % population)
-        print( "   -> Number of elite chromosomes: %d" % elitism)
-        print( "   -> Number of generations: %d" % generations)
-        print( "   -> Crossover rate: %.2f" % cross_rate)
-        print( "   -> Mutation rate:  %.2f" % mut_rate)
-
-        if selection == 'wheel':
-            print( "   -> Selection: wheel roulette\n\n")
-        elif selection == 'ranking':
-            print( "   -> Selection: ranking \n\n")
-        else:
-            print( "   -> Selection: tournament with %d individuals\n\n" % pressure)
 
-    times = np.zeros(len(toProcess))
+# Sequence mode of Enhancify: the frames of a multi-page TIFF image (or the images of a folder, sorted by name) are
+# processed in order, each one warm-started from the best mapping of the previous frame
+def runSequence(imagePath, folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, verbose, options,
+                warmGenerations):
 
-    # Processing the images in the input folder
-    # The input images are characterized by an undelying bimodal histogram (intensity level distribution)
-    # Possibly, previously masked and cropped images (according to a bounding region containing the Region of Interest)
-    for i in range(len(toProcess)):
+    from src.sequence import readFrames, enhanceSequence
+
+    startAll = time.time()
 
-        # Output folders
-        string = toProcess[i].split("/")[1:]
-        subfolder = string[-1].split(".")[:-1]
+    toProcess = sorted(collectImages(imagePath, folderIn))
 
-        pathOutput = folderOut+os.sep+subfolder[0]
+    if not os.path.exists(folderOut):
+        os.makedirs(folderOut)
+
+    if len(toProcess) == 0:
+        print( "******************************************************************************************")
+        exit(-11)
 
+    # The frames of a stack are saved into <output>/<image>/frame_0000, <output>/<image>/frame_0001, ...
+    if folderIn is None:
+        frames = readFrames(imagePath)
+        names  = [imagePath + " (frame %d)" % k for k in range(len(frames))]
+        pathsOutput = [outputFolder(folderOut, imagePath) + os.sep + "frame_%04d" % k for k in range(len(frames))] if len(frames) > 1 else [outputFolder(folderOut, imagePath)]
+    else:
+        frames = names = toProcess
+        pathsOutput = [outputFolder(folderOut, path) for path in toProcess]
+
+    for pathOutput in pathsOutput:
         if not os.path.exists(pathOutput):
             os.makedirs(pathOutput)
 
-        if verbose:
-            print( " * Analyzed image %s" % toProcess[i])
-            start = time.time()
+    if verbose:
+        printSettings("sequence", population, generations, selection, cross_rate, mut_rate, pressure, elitism, options)
+        print( " * Warm-started frames: %s generations, perturbation %.3f, reuse distance %.3f\n\n" %
+               (warmGenerations if warmGenerations is not None else "default", options["perturbation"], options["reuseDistance"]))
+
+    results = enhanceSequence(frames, population, generations, selection, cross_rate, mut_rate, elitism, pressure,
+                              warmGenerations=warmGenerations, pathsOutput=pathsOutput, **options)
 
-        # Enhancify execution on the image to be processed by using the provided GA settings
-        enhancify = Enhancify(toProcess[i], pathOutput)
-        enhancify.startGA(population, generations, selection,
-                      cross_rate, mut_rate, elitism, pressure)
+    elapsedAll = time.time() - startAll
 
-        end = time.time()
-        elapsed = end-start
+    if options["metrics"]:
+        aggregateMetrics(pathsOutput, folderOut)
+
+    if verbose:
+        for name, result in zip(names, results):
+            print( " * Analyzed image %s" % name)
+            print( "-> Best fitness %f (%s)" % (result.fitness, result.reason))
+            print( "-> Elapsed time %5.2fs" % result.elapsed)
+
+        print( "\n * Total elapsed time %5.2fs" % elapsedAll, "for computing", len(results), "frames")
+        print( " * Mean elapsed time  %5.2fs per frame" % np.mean([result.elapsed for result in results]))
+        print( "******************************************************************************************")
+
+# Sequential version of Enhancify
+
+
+def run(imagePath, folderIn, folderOut, population, generations, selection, cross_rate, mut_rate, pressure, elitism, verbose, options, dedup=True):
+
+    startAll = time.time()
+
+    toProcess = collectImages(imagePath, folderIn)
+
+    if not os.path.exists(folderOut):
+        os.makedirs(folderOut)
+
+    if len(toProcess) == 0:
+        print( "******************************************************************************************")
+        exit(-11)
+
+    if verbose:
+        printSettings("sequential", population, generations, selection, cross_rate, mut_rate, pressure, elitism, options)
+
+    # Output folders
+    pathsOutput = [outputFolder(folderOut, toProcess[i]) for i in range(len(toProcess))]
+
+    # The images with the same histogram are processed by a single GA run
+    groups = imageGroups(toProcess, options, dedup)
+    times = np.zeros(len(groups))
+
+    # Processing the images in the input folder
+    # The input images are characterized by an undelying bimodal histogram (intensity level distribution)
+    # Possibly, previously masked and cropped images (according to a bounding region containing the Region of Interest)
+    for i, group in enumerate(groups):
+
+        if verbose:
+            print( " * Analyzed image %s" % groupName([toProcess[j] for j in group]))
+
+        # Enhancify execution on the images to be processed by using the provided GA settings
+        elapsed, cacheStatistics = processGroup([toProcess[j] for j in group], [pathsOutput[j] for j in group], population, generations, selection,
+                                                cross_rate, mut_rate, pressure, elitism, options)
         times[i] = elapsed
 
         if verbose:
+            if options["cacheSize"] > 0:
+                print( "-> Fitness cache: %d hits, %d misses" % cacheStatistics)
             print( "-> Elapsed time %5.2fs" % (elapsed))
 
-        endAll = time.time()
-        elapsedAll = endAll-startAll
+    endAll = time.time()
+    elapsedAll = endAll-startAll
+
+    if options["metrics"]:
+        aggregateMetrics(pathsOutput, folderOut)
 
     if verbose:
         if len(toProcess) > 1:
-            print( "\n * Total elapsed time %5.2fs" % elapsedAll, "for computing", len(toProcess), "images")
-            print( " * Mean elapsed time  %5.2fs per image" % np.mean(times))
+            print( "\n * Total elapsed time %5.2fs" % elapsedAll, "for computing", len(toProcess), "images (%d GA runs)" % len(groups))
+            print( " * Mean elapsed time  %5.2fs per GA run" % np.mean(times))
         print( "******************************************************************************************")
 
 
@@ -176,13 +359,56 @@ if __name__ == '__main__':
          -e <elitism>     (default: 1)
          -d <distributed> (default: False)
          -t <cores>       (default: 4)
-         -v <verbose>     (default: False)"""
+         -v <verbose>     (default: False)
+         --cache_size <entries> (default: 10000, 0 disables the fitness cache)
+         --seed <seed>    (default: None, random)
+         --fitness_workers <processes> (default: 1, evaluating the population of each image in parallel)
+         --workers <processes> (default: 1, processing the images in parallel without MPI)
+         --islands <islands> (default: 1, number of sub-populations evolving on separate processes)
+         --migration_interval <generations> (default: 10)
+         --migrants <migrants> (default: 2, best chromosomes sent by each island)
+         --topology <topology> (default: ring, either ring or full)
+         --trace_format <format> (default: text, either text, npz or both)
+         --trace_flush <generations> (default: 100, 0 writes the traces only at the end of the run)
+         --checkpoint <generations> (default: 0, saving the GA state every <generations> generations; 0 disables it)
+         --resume         (default: False, resuming the runs from their checkpoints and skipping the completed images)
+         --stagnation <generations> (default: 0, stopping when the best fitness does not improve for <generations> generations)
+         --epsilon <epsilon> (default: 0.0, minimum improvement of the best fitness)
+         --target_fitness <fitness> (default: None, stopping when the best fitness is not larger than <fitness>)
+         --time_budget <seconds> (default: 0, maximum wall-clock seconds for each image; 0 disables it)
+         --histogram_cache <folder> (default: None, folder caching the histograms of the images by a hash of their content, e.g., shared
+                          by the runs of a parameter sweep; imageOriginal.png is saved whether or not the histogram is cached)
+         --histograms <mode> (default: auto, either dense, sparse or auto, i.e., sparse for images with more than 256 gray levels)
+         --level_binning <levels> (default: 1, number of consecutive gray levels grouped into a bin of the GA)
+         --no_figures     (default: False, the comparison figures imageConf0.png and imageConfBest.png are not saved)
+         --metrics        (default: False, saving the time of each GA phase and per-generation records into metrics.json and metrics.csv)
+         --profile        (default: False, profiling each run with cProfile into profile.prof)
+         --serve <address> (default: None, running as a daemon that accepts jobs on host:port or unix:<socket>, see src/server.py;
+                          the pool has --workers processes and the provided GA settings are the defaults of the jobs)
+         --queue_size <jobs> (default: 16, jobs waiting for a worker of the daemon before the new ones are rejected)
+         --sequence       (default: False, processing the frames of a multi-page TIFF image, or the images of a folder sorted by name, in order;
+                          each frame is warm-started from the best mapping of the previous frame)
+         --warm_generations <generations> (default: generations/10, generations of the warm-started frames)
+         --perturbation <perturbation> (default: 0.02, noise added to the previous mapping, as a fraction of the gray levels)
+         --reuse_distance <distance> (default: 0.0, the previous mapping is reused without running the GA when the histograms differ by less than <distance>)
+         --library <folder> (default: None, library of the solutions of the completed runs, used to seed the initial populations)
+         --library_seeds <solutions> (default: 5, nearest solutions of the library seeding each initial population)
+         --library_fraction <fraction> (default: 0.1, fraction of the initial population seeded from the library, at least the nearest solutions)
+         --no_dedup       (default: False, the GA runs on each image even when several images of a folder have the same histogram)"""
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], "hi:f:o:p:g:s:c:m:k:e:t:dv", ["help", "image", "folder", "output",
                                                                                "population", "generations", "selection",
                                                                                "cross_rate", "mut_rate", "pressure",
-                                                                               "elitism", "cores", "distributed", "verbose"])
+                                                                               "elitism", "cores", "distributed", "verbose",
+                                                                               "cache_size=", "seed=", "fitness_workers=", "workers=",
+                                                                               "islands=", "migration_interval=", "migrants=", "topology=",
+                                                                               "trace_format=", "trace_flush=", "checkpoint=", "resume", "stagnation=", "epsilon=",
+                                                                               "target_fitness=", "time_budget=", "histogram_cache=", "histograms=",
+                                                                               "level_binning=", "no_figures", "metrics", "profile",
+                                                                               "serve=", "queue_size=", "sequence", "warm_generations=",
+                                                                               "perturbation=", "reuse_distance=", "library=", "library_seeds=",
+                                                                               "library_fraction=", "no_dedup"])
     except:
         print( helpString)
         exit(-1)
@@ -205,6 +431,38 @@ if __name__ == '__main__':
     mpi = False
     cores = 5
     verbose = False
+    cacheSize = 10000
+    seed = None
+    fitnessWorkers = 1
+    workers = 1
+    islands = 1
+    migrationInterval = 10
+    migrants = 2
+    topology = "ring"
+    traceFormat = "text"
+    traceFlush = 100
+    checkpointInterval = 0
+    resume = False
+    stagnation = 0
+    epsilon = 0.0
+    targetFitness = None
+    timeBudget = 0
+    histogramCache = None
+    histograms = "auto"
+    levelBinning = 1
+    figures = True
+    metrics = False
+    profile = False
+    serve = None
+    queueSize = 16
+    sequence = False
+    warmGenerations = None
+    perturbation = 0.02
+    reuseDistance = 0.0
+    library = None
+    librarySeeds = 5
+    libraryFraction = 0.1
+    dedup = True
 
     warning = False
     alreadyprint = False
@@ -317,6 +575,262 @@ if __name__ == '__main__':
         elif opt in ("-v", "--verbose"):
             verbose = True
 
+        elif opt == "--cache_size":
+            try:
+                cacheSize = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided cache_size is not correct. It has been set to 10000")
+                cacheSize = 10000
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--seed":
+            try:
+                seed = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided seed is not correct. A random seed will be used")
+                seed = None
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--fitness_workers":
+            try:
+                fitnessWorkers = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided number of fitness workers is not correct. It has been set to 1")
+                fitnessWorkers = 1
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--workers":
+            try:
+                workers = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided number of workers is not correct. It has been set to 1")
+                workers = 1
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--islands":
+            try:
+                islands = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided number of islands is not correct. It has been set to 1")
+                islands = 1
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--migration_interval":
+            try:
+                migrationInterval = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided migration interval is not correct. It has been set to 10")
+                migrationInterval = 10
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--migrants":
+            try:
+                migrants = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided number of migrants is not correct. It has been set to 2")
+                migrants = 2
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--topology":
+            topology = arg
+
+        elif opt == "--trace_format":
+            traceFormat = arg
+
+        elif opt == "--trace_flush":
+            try:
+                traceFlush = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided trace flush interval is not correct. It has been set to 100")
+                traceFlush = 100
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--checkpoint":
+            try:
+                checkpointInterval = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided checkpoint interval is not correct. It has been set to 0")
+                checkpointInterval = 0
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--resume":
+            resume = True
+
+        elif opt == "--stagnation":
+            try:
+                stagnation = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided stagnation is not correct. It has been set to 0")
+                stagnation = 0
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--epsilon":
+            try:
+                epsilon = float(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided epsilon is not correct. It has been set to 0.0")
+                epsilon = 0.0
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--target_fitness":
+            try:
+                targetFitness = float(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided target fitness is not correct. It has been set to None")
+                targetFitness = None
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--histogram_cache":
+            histogramCache = arg
+
+        elif opt == "--no_figures":
+            figures = False
+
+        elif opt == "--metrics":
+            metrics = True
+
+        elif opt == "--profile":
+            profile = True
+
+        elif opt == "--serve":
+            serve = arg
+
+        elif opt == "--sequence":
+            sequence = True
+
+        elif opt == "--warm_generations":
+            try:
+                warmGenerations = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided number of warm generations is not correct. It has been set to generations/10")
+                warmGenerations = None
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--perturbation":
+            try:
+                perturbation = float(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided perturbation is not correct. It has been set to 0.02")
+                perturbation = 0.02
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--reuse_distance":
+            try:
+                reuseDistance = float(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided reuse distance is not correct. It has been set to 0.0")
+                reuseDistance = 0.0
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--library":
+            library = arg
+
+        elif opt == "--library_seeds":
+            try:
+                librarySeeds = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided number of library seeds is not correct. It has been set to 5")
+                librarySeeds = 5
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--library_fraction":
+            try:
+                libraryFraction = float(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided library fraction is not correct. It has been set to 0.1")
+                libraryFraction = 0.1
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--no_dedup":
+            dedup = False
+
+        elif opt == "--queue_size":
+            try:
+                queueSize = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided queue size is not correct. It has been set to 16")
+                queueSize = 16
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--histograms":
+            histograms = arg
+
+        elif opt == "--level_binning":
+            try:
+                levelBinning = int(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided level binning is not correct. It has been set to 1")
+                levelBinning = 1
+                warning = True
+                alreadyprint = True
+
+        elif opt == "--time_budget":
+            try:
+                timeBudget = float(arg)
+            except:
+                if not alreadyprint:
+                    print( "******************************************************************************************")
+                print( " * Warning, the provided time budget is not correct. It has been set to 0")
+                timeBudget = 0
+                warning = True
+                alreadyprint = True
+
     if warning:
         print(warning)
 
@@ -386,7 +900,195 @@ if __name__ == '__main__':
         warning = True
         alreadyprint = True
 
-    if (imagePath is None) and (folderIn is None):
+    if cacheSize < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided cache_size is %d. It has been set to 10000" % cacheSize)
+        cacheSize = 10000
+        warning = True
+        alreadyprint = True
+
+    if fitnessWorkers <= 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided number of fitness workers is %d. It has been set to 1" % fitnessWorkers)
+        fitnessWorkers = 1
+        warning = True
+        alreadyprint = True
+
+    if workers <= 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided number of workers is %d. It has been set to 1" % workers)
+        workers = 1
+        warning = True
+        alreadyprint = True
+
+    if islands <= 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided number of islands is %d. It has been set to 1" % islands)
+        islands = 1
+        warning = True
+        alreadyprint = True
+
+    if migrationInterval <= 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided migration interval is %d. It has been set to 10" % migrationInterval)
+        migrationInterval = 10
+        warning = True
+        alreadyprint = True
+
+    if (migrants <= 0) or (migrants >= population):
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided number of migrants is %d. It has been set to 2" % migrants)
+        migrants = 2
+        warning = True
+        alreadyprint = True
+
+    if topology not in ["ring", "full"]:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided topology is %s. It has been set to ring" % topology)
+        topology = "ring"
+        warning = True
+        alreadyprint = True
+
+    if traceFormat not in ["text", "npz", "both"]:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided trace format is %s. It has been set to text" % traceFormat)
+        traceFormat = "text"
+        warning = True
+        alreadyprint = True
+
+    if traceFlush < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided trace flush interval is %d. It has been set to 100" % traceFlush)
+        traceFlush = 100
+        warning = True
+        alreadyprint = True
+
+    if checkpointInterval < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided checkpoint interval is %d. It has been set to 0" % checkpointInterval)
+        checkpointInterval = 0
+        warning = True
+        alreadyprint = True
+
+    if stagnation < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided stagnation is %d. It has been set to 0" % stagnation)
+        stagnation = 0
+        warning = True
+        alreadyprint = True
+
+    if epsilon < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided epsilon is %f. It has been set to 0.0" % epsilon)
+        epsilon = 0.0
+        warning = True
+        alreadyprint = True
+
+    if timeBudget < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided time budget is %f. It has been set to 0" % timeBudget)
+        timeBudget = 0
+        warning = True
+        alreadyprint = True
+
+    if histograms not in ["auto", "dense", "sparse"]:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided histogram mode is %s. It has been set to auto" % histograms)
+        histograms = "auto"
+        warning = True
+        alreadyprint = True
+
+    if levelBinning <= 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided level binning is %d. It has been set to 1" % levelBinning)
+        levelBinning = 1
+        warning = True
+        alreadyprint = True
+
+    if queueSize < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided queue size is %d. It has been set to 16" % queueSize)
+        queueSize = 16
+        warning = True
+        alreadyprint = True
+
+    if warmGenerations is not None and warmGenerations <= 1:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided number of warm generations is %d. It has been set to generations/10" % warmGenerations)
+        warmGenerations = None
+        warning = True
+        alreadyprint = True
+
+    if perturbation < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided perturbation is %f. It has been set to 0.02" % perturbation)
+        perturbation = 0.02
+        warning = True
+        alreadyprint = True
+
+    if reuseDistance < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided reuse distance is %f. It has been set to 0.0" % reuseDistance)
+        reuseDistance = 0.0
+        warning = True
+        alreadyprint = True
+
+    if librarySeeds < 0:
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided number of library seeds is %d. It has been set to 5" % librarySeeds)
+        librarySeeds = 5
+        warning = True
+        alreadyprint = True
+
+    if (libraryFraction < 0) or (libraryFraction > 1):
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the provided library fraction is %f. It has been set to 0.1" % libraryFraction)
+        libraryFraction = 0.1
+        warning = True
+        alreadyprint = True
+
+    # The frames of a sequence depend on each other, so they are processed in order by a single process
+    if sequence and (mpi or workers > 1):
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, the frames of a sequence are processed in order. The distributed and parallel versions have been disabled")
+        mpi = False
+        workers = 1
+        warning = True
+        alreadyprint = True
+
+    # The islands exchange individuals during the run, so they cannot be resumed independently
+    if islands > 1 and (checkpointInterval > 0 or resume):
+        if not alreadyprint:
+            print( "******************************************************************************************")
+        print( " * Warning, checkpoints are not supported by the island model. They have been disabled")
+        checkpointInterval = 0
+        resume = False
+        warning = True
+        alreadyprint = True
+
+    if (imagePath is None) and (folderIn is None) and (serve is None):
         if not alreadyprint:
             print( "******************************************************************************************")
         print( " * Please, provide either an image or a folder containing at least an image")
@@ -405,12 +1107,43 @@ if __name__ == '__main__':
 
 
 # ************************************************ Running Enhancify ************************************************
-    if mpi and folderIn is not None:
+    # Options of Enhancify.startGA, completed with the default ones (see Enhancify_sequential.defaultOptions)
+    options = runOptions({"cacheSize": cacheSize, "seed": seed, "fitnessWorkers": fitnessWorkers,
+                          "islands": islands, "migrationInterval": migrationInterval, "migrants": migrants, "topology": topology,
+                          "traceFormat": traceFormat, "traceFlush": traceFlush,
+                          "checkpointInterval": checkpointInterval, "resume": resume,
+                          "stagnation": stagnation, "epsilon": epsilon, "targetFitness": targetFitness, "timeBudget": timeBudget,
+                          "histogramCache": histogramCache, "sparse": {"auto": None, "dense": False, "sparse": True}[histograms],
+                          "levelBinning": levelBinning, "figures": figures, "metrics": metrics, "profile": profile,
+                          "perturbation": perturbation, "reuseDistance": reuseDistance,
+                          "library": library, "librarySeeds": librarySeeds, "libraryFraction": libraryFraction})
+
+    if serve is not None:
+        # Run the worker daemon: the jobs are enhanced by a pool of warmed-up processes
+        from src.server import enhancementServer
+
+        defaults = {"pop_size": population, "numGen": generations, "selection": selection, "cross_rate": cross_rate,
+                    "mut_rate": mut_rate, "elitism": elitism, "numberIndTour": pressure}
+        defaults.update(options)
+
+        server = enhancementServer(serve, defaults, workers, queueSize, verbose)
+        print( " * Enhancify is serving on %s with %d workers (%d queued jobs at most)" % (server.address, workers, queueSize))
+        sys.stdout.flush()
+        server.serveForever()
+    elif sequence:
+        # Run the sequence mode on the frames of a stack or on the images of a folder
+        runSequence(imagePath, folderIn, folderOut, population, generations, selection,
+                    cross_rate, mut_rate, pressure, elitism, verbose, options, warmGenerations)
+    elif mpi and folderIn is not None:
         # Run MPI version on a folder
         runMPI(folderIn, folderOut, population, generations, selection,
-               cross_rate, mut_rate, pressure, elitism, cores, verbose)
+               cross_rate, mut_rate, pressure, elitism, cores, verbose, options, dedup)
+    elif workers > 1:
+        # Run local parallel version on either a folder or a single image
+        runLocal(imagePath, folderIn, folderOut, population, generations,
+                 selection, cross_rate, mut_rate, pressure, elitism, verbose, options, workers, dedup)
     else:
         # Run sequential version on either a folder or a single image
         run(imagePath, folderIn, folderOut, population, generations,
-            selection, cross_rate, mut_rate, pressure, elitism, verbose)
+            selection, cross_rate, mut_rate, pressure, elitism, verbose, options, dedup)
 
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import getopt
+import platform
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from src.GA import geneticOperation, population
+from src.fitness import remapHistograms, calculateFitnessBatch, calculateVariancesBatch, calculateVariancesSparse
+from src.thresholding import optimalThreshold, optimalThresholdBatch, optimalThresholdSparse
+from src.imageProcessing import processing
+
+# Micro-benchmarks of the GA kernels on synthetic bimodal images of several sizes and bit depths
+# The results (seconds per call) are written as JSON, e.g.:
+#   python benchmarks/microbenchmarks.py -o results.json
+
+# Synthetic image with a bimodal histogram and a background of zeros (first rows)
+def bimodalImage(size, bitDepth, seed=0):
+
+    rng = np.random.default_rng(seed)
+    levels = 2**bitDepth
+
+    pixels = size * size
+    modes = np.concatenate([rng.normal(0.3*levels, 0.08*levels, pixels // 2), rng.normal(0.7*levels, 0.08*levels, pixels - pixels // 2)])
+    rng.shuffle(modes)
+
+    image = np.clip(np.rint(modes), 1, levels-1).astype(np.uint8 if bitDepth <= 8 else np.uint16).reshape(size, size)
+    image[:size // 20] = 0
+
+    return image
+
+# Calling function number times for each repetition; number is increased until a repetition lasts at least minTime seconds
+def measure(function, repeat, minTime=0.05):
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for k in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= minTime or number >= 1 << 16:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(np.ceil(minTime / elapsed)))
+
+    times = [elapsed / number]
+    for r in range(repeat - 1):
+        start = time.perf_counter()
+        for k in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+
+    return number, times
+
+# Benchmarks of the kernels working on the histogram of an image (the image itself is not needed)
+def histogramBenchmarks(image, popSize, seed=0):
+
+    hist, maxValue, T_k = processing().calculateHistogram(image)
+    noZeroPosHist = list(np.nonzero(hist)[0])
+    numberOfGenes = len(noZeroPosHist)
+
+    rng = np.random.default_rng(seed)
+    op  = geneticOperation(rng)
+
+    pop = population(hist, noZeroPosHist, numberOfGenes, 1, maxValue, popSize)
+    pop.initialize(rng)
+    pop.evaluate()
+    pop.sort()
+
+    single = pop.getChromosome(0)
+    other  = pop.getChromosome(1)
+
+    hists = remapHistograms(pop.genes, hist, noZeroPosHist, maxValue)
+    weights = np.broadcast_to(hist[noZeroPosHist], pop.genes.shape)
+    opt_T, mu1, mu2 = optimalThresholdBatch(hists, 0.001, 100)
+
+    numPairs = popSize // 2
+    cross_points = rng.integers(0, numberOfGenes, numPairs)
+    crossover = rng.random(numPairs) < 0.9
+    children = (np.empty((numPairs, numberOfGenes), dtype=np.int64), np.empty((numPairs, numberOfGenes), dtype=np.int64))
+    mutated = pop.genes.copy()
+
+    genes = {"genes": numberOfGenes}
+    return [
+        ("chromosome.calculateFitness", genes, lambda: single.calculateFitness(hist, noZeroPosHist, maxValue, 1)),
+        ("calculateFitnessBatch.dense", genes, lambda: calculateFitnessBatch(pop.genes, hist, noZeroPosHist, maxValue)),
+        ("calculateFitnessBatch.sparse", genes, lambda: calculateFitnessBatch(pop.genes, hist, noZeroPosHist, maxValue, True)),
+        ("remapHistograms", genes, lambda: remapHistograms(pop.genes, hist, noZeroPosHist, maxValue)),
+        ("optimalThreshold", genes, lambda: optimalThreshold(hist, 0.001, 100)),
+        ("optimalThresholdBatch", genes, lambda: optimalThresholdBatch(hists, 0.001, 100)),
+        ("optimalThresholdSparse", genes, lambda: optimalThresholdSparse(pop.genes, weights, int(maxValue)+1, 0.001, 100)),
+        ("calculateVariancesBatch", genes, lambda: calculateVariancesBatch(hists, opt_T, mu1, mu2)),
+        ("calculateVariancesSparse", genes, lambda: calculateVariancesSparse(pop.genes, weights, opt_T, mu1, mu2)),
+        ("crossoverUniform", genes, lambda: op.crossoverUniform(single, other, None)),
+        ("crossoverPopulation", genes, lambda: op.crossoverPopulation(pop.genes[0::2][:numPairs], pop.genes[1::2][:numPairs], cross_points, crossover, out=children)),
+        ("mutate", genes, lambda: op.mutate(mutated, 1, maxValue, pop.opt_T, 0.01)),
+        ("selectParents.tournament", genes, lambda: op.selectParents(pop.fitness, numPairs, 'tournament', 20)),
+        ("selectParents.wheel", genes, lambda: op.selectParents(pop.fitness, numPairs, 'wheel')),
+        ("selectParents.ranking", genes, lambda: op.selectParents(pop.fitness, numPairs, 'ranking')),
+    ]
+
+# Benchmarks of the kernels working on the whole image
+def imageBenchmarks(image, folder, seed=0):
+
+    hist, maxValue, T_k = processing().calculateHistogram(image)
+    noZeroPosHist = list(np.nonzero(hist)[0])
+    numberOfGenes = len(noZeroPosHist)
+
+    pop = population(hist, noZeroPosHist, numberOfGenes, 1, maxValue, 1)
+    pop.initialize(np.random.default_rng(seed))
+    best = pop.getChromosome(0)
+
+    name = folder + os.sep + 'image.png'
+    nameConf = folder + os.sep + 'imageConf.png'
+
+    genes = {"genes": numberOfGenes}
+    return [
+        ("calculateHistogram", genes, lambda: processing().calculateHistogram(image)),
+        ("saveCurrentImage", genes, lambda: best.saveCurrentImage(hist, noZeroPosHist, image, name, None)),
+        ("saveCurrentImage.figures", genes, lambda: best.saveCurrentImage(hist, noZeroPosHist, image, name, nameConf)),
+    ]
+
+def main():
+
+    helpString = """ Micro-benchmarks of Enhancify
+
+         -o <output>      (default: standard output, JSON file of the results)
+         -r <repeat>      (default: 5, repetitions of each benchmark)
+         -p <population>  (default: 100)
+         -k <filter>      (default: all, only the benchmarks whose name contains <filter>)
+         -q <quick>       (default: False, only the smallest images)"""
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "ho:r:p:k:q")
+    except getopt.GetoptError:
+        print(helpString)
+        exit(-1)
+
+    output = None
+    repeat = 5
+    popSize = 100
+    nameFilter = ""
+    quick = False
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(helpString)
+            exit(0)
+        elif opt == "-o":
+            output = arg
+        elif opt == "-r":
+            repeat = int(arg)
+        elif opt == "-p":
+            popSize = int(arg)
+        elif opt == "-k":
+            nameFilter = arg
+        elif opt == "-q":
+            quick = True
+
+    sizes = [256] if quick else [256, 1024, 2048]
+    bitDepths = [8, 12, 16]
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for bitDepth in bitDepths:
+            for size in sizes:
+                image = bimodalImage(size, bitDepth)
+
+                # The kernels on histograms do not depend on the size of the image, unless the number of genes changes
+                benchmarks = imageBenchmarks(image, folder)
+                if size == sizes[-1]:
+                    benchmarks = histogramBenchmarks(image, popSize) + benchmarks
+
+                for name, params, function in benchmarks:
+                    if nameFilter not in name:
+                        continue
+
+                    number, times = measure(function, repeat)
+
+                    record = {"benchmark": name, "bitDepth": bitDepth, "size": size, "population": popSize}
+                    record.update(params)
+                    record.update({"number": number, "repeat": repeat, "best": min(times), "median": float(np.median(times)), "mean": float(np.mean(times))})
+                    results.append(record)
+
+                    sys.stderr.write("%-30s %2d bit %5d px  %12.6f ms\n" % (name, bitDepth, size, 1000*min(times)))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+        },
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "unit": "seconds per call",
+        "results": results,
+    }
+
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(output, "w") as fo:
+            json.dump(report, fo, indent=2)
+
+if __name__ == '__main__':
+    main()
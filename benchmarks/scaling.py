@@ -0,0 +1,230 @@
+import os
+import re
+import sys
+import json
+import time
+import getopt
+import shutil
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+from microbenchmarks import bimodalImage
+
+# End-to-end scaling benchmark: a folder of synthetic bimodal images is processed by Enhancify.py
+# with every combination of the provided settings, e.g.:
+#   python benchmarks/scaling.py -n 16 -s 256,512 -p 50,100 -g 100 -w 1,2,4 -m sequential,local,mpi -o scaling.json
+# Each run reports throughput, percentiles of the per-image latency, parallel efficiency and best fitness reached
+# A run whose status is not "ok" (failed, or an mpi run that fell back to the local workers) reports no measurements
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Folder of synthetic 8-bit images
+def syntheticFolder(folder, images, size):
+
+    import imageio
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    for k in range(images):
+        imageio.imwrite(folder + os.sep + 'image%03d.png' % k, bimodalImage(size, 8, seed=k))
+
+    return folder
+
+# Command line of Enhancify.py for a mode: sequential, local (pool of processes) or mpi
+# The MPI version uses a master process, so that workers+1 processes are started
+# The local mode requires at least 2 workers, since Enhancify.py runs the sequential version with a single worker
+def command(mode, folderIn, folderOut, population, generations, workers, seed):
+
+    run = [sys.executable, "Enhancify.py", "-f", folderIn, "-o", folderOut, "-p", str(population), "-g", str(generations),
+           "-v", "--seed", str(seed), "--no_figures"]
+
+    if mode == "local":
+        run += ["--workers", str(workers)]
+    elif mode == "mpi":
+        run += ["-d", "-t", str(workers + 1)]
+
+    return run
+
+# Warnings printed by Enhancify.py when the MPI version is not run, and the local workers process the images instead
+mpiFallbacks = ("neither mpiexec nor mpirun are available", "the MPI version of Enhancify failed")
+
+# Status of a run: ok, failed (non-zero exit code) or fallback (mpi mode run by the local workers)
+def runStatus(mode, stdout, returncode):
+
+    if returncode != 0:
+        return "failed"
+
+    if mode == "mpi" and any(warning in stdout for warning in mpiFallbacks):
+        return "fallback"
+
+    return "ok"
+
+# Best fitness reached on each image (last line of its fitness trace)
+def bestFitness(folderOut):
+
+    values = []
+    for path in sorted(os.listdir(folderOut)):
+        trace = folderOut + os.sep + path + os.sep + 'fitness'
+        if os.path.exists(trace):
+            with open(trace) as fi:
+                lines = fi.read().split()
+            if lines:
+                values.append(float(lines[-1]))
+
+    return values
+
+def runOnce(mode, folderIn, population, generations, workers, seed):
+
+    folderOut = tempfile.mkdtemp(prefix='enhancify_scaling_')
+
+    start = time.perf_counter()
+    completed = subprocess.run(command(mode, folderIn, folderOut, population, generations, workers, seed),
+                               cwd=root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    wall = time.perf_counter() - start
+
+    # Per-image latencies printed by the verbose runners (the totals are written as "elapsed time")
+    latencies = [float(value) for value in re.findall(r"Elapsed time\s+([0-9.]+)s", completed.stdout)]
+    fitness = bestFitness(folderOut)
+
+    shutil.rmtree(folderOut, ignore_errors=True)
+
+    status = runStatus(mode, completed.stdout, completed.returncode)
+    if status != "ok":
+        sys.stderr.write(completed.stdout)
+
+    return wall, latencies, fitness, completed.returncode, status
+
+def main():
+
+    helpString = """ End-to-end scaling benchmark of Enhancify
+
+         -n <images>      (default: 8, number of synthetic images)
+         -s <sizes>       (default: 256, comma-separated sizes of the images)
+         -p <populations> (default: 50, comma-separated population sizes)
+         -g <generations> (default: 50, comma-separated numbers of generations)
+         -w <workers>     (default: 1,2,4, comma-separated numbers of workers; the local mode skips 1 worker, i.e., the sequential run)
+         -m <modes>       (default: sequential,local, comma-separated modes among sequential, local and mpi)
+         -r <repeat>      (default: 1, repetitions of each run)
+         -o <output>      (default: standard output, JSON file of the results)
+         -c <csv>         (default: None, CSV file of the results)"""
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:s:p:g:w:m:r:o:c:")
+    except getopt.GetoptError:
+        print(helpString)
+        exit(-1)
+
+    images = 8
+    sizes = [256]
+    populations = [50]
+    generationsList = [50]
+    workersList = [1, 2, 4]
+    modes = ["sequential", "local"]
+    repeat = 1
+    output = None
+    csv = None
+
+    integers = lambda arg: [int(value) for value in arg.split(",")]
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(helpString)
+            exit(0)
+        elif opt == "-n":
+            images = int(arg)
+        elif opt == "-s":
+            sizes = integers(arg)
+        elif opt == "-p":
+            populations = integers(arg)
+        elif opt == "-g":
+            generationsList = integers(arg)
+        elif opt == "-w":
+            workersList = integers(arg)
+        elif opt == "-m":
+            modes = arg.split(",")
+        elif opt == "-r":
+            repeat = int(arg)
+        elif opt == "-o":
+            output = arg
+        elif opt == "-c":
+            csv = arg
+
+    if "mpi" in modes and shutil.which("mpiexec") is None and shutil.which("mpirun") is None:
+        sys.stderr.write(" * Warning, neither mpiexec nor mpirun are available. The mpi mode is skipped\n")
+        modes = [mode for mode in modes if mode != "mpi"]
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            folderIn = syntheticFolder(folder + os.sep + 'size%d' % size, images, size)
+
+            for population in populations:
+                for generations in generationsList:
+
+                    # The sequential run of the same settings is the reference of the parallel efficiency
+                    baseline = None
+
+                    for mode in modes:
+                        for workers in ([1] if mode == "sequential" else [w for w in workersList if w > 1 or mode == "mpi"]):
+                            for r in range(repeat):
+                                wall, latencies, fitness, returncode, status = runOnce(mode, folderIn, population, generations, workers, r)
+
+                                # The measurements of a failed or fallback run do not describe the mode
+                                if status != "ok":
+                                    wall, latencies, fitness = None, [], []
+
+                                throughput = images * 60.0 / wall if wall else None
+                                if mode == "sequential" and baseline is None:
+                                    baseline = throughput
+
+                                record = {
+                                    "mode": mode, "workers": workers, "images": images, "size": size,
+                                    "population": population, "generations": generations, "repetition": r,
+                                    "status": status, "returncode": returncode, "wall": wall, "throughput": throughput,
+                                    "efficiency": throughput / (workers * baseline) if baseline and throughput else None,
+                                    "latencyP50": float(np.percentile(latencies, 50)) if latencies else None,
+                                    "latencyP90": float(np.percentile(latencies, 90)) if latencies else None,
+                                    "latencyP99": float(np.percentile(latencies, 99)) if latencies else None,
+                                    "bestFitness": float(np.min(fitness)) if fitness else None,
+                                    "meanBestFitness": float(np.mean(fitness)) if fitness else None,
+                                }
+                                results.append(record)
+
+                                if status != "ok":
+                                    sys.stderr.write("%-10s %2d workers %5d px p=%-4d g=%-5d %s\n" %
+                                                     (mode, workers, size, population, generations, status))
+                                    continue
+
+                                sys.stderr.write("%-10s %2d workers %5d px p=%-4d g=%-5d %8.2f images/min  efficiency %s\n" %
+                                                 (mode, workers, size, population, generations, throughput,
+                                                  "-" if record["efficiency"] is None else "%.2f" % record["efficiency"]))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(output, "w") as fo:
+            json.dump(report, fo, indent=2)
+
+    if csv is not None and results:
+        with open(csv, "w") as fo:
+            fo.write(",".join(results[0].keys()) + "\n")
+            for record in results:
+                fo.write(",".join("" if value is None else str(value) for value in record.values()) + "\n")
+
+if __name__ == '__main__':
+    main()
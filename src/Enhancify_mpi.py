@@ -1,14 +1,19 @@
-import sys, glob, os, time
+import sys, glob, os, time, json
 import numpy as np
 
+# The modules of Enhancify are imported both from this folder and from the root of the repository (src package)
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from mpi4py import MPI
-from Enhancify_sequential import Enhancify
+from enhance import enhanceGroup
+from imageProcessing import processing
+from metrics import aggregateMetrics
 
 WORKTAG = 0
 DIETAG = 1
 
 # Master process. It distributes the images among the slaves and collects the elapsed times
-def master(toProcess, pathsOutput, population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose):
+def master(toProcess, pathsOutput, population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose, options):
 
 	n = len(toProcess)
 	status = MPI.Status()
@@ -27,7 +32,7 @@ def master(toProcess, pathsOutput, population, generations, selection, cross_rat
 	# (size-1) images are run in parallel
 	if n > (size-1):
 		for i in range(1, size):
-			inp = [toProcess[i-1], pathsOutput[i-1], population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose]
+			inp = [toProcess[i-1], pathsOutput[i-1], population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose, options]
 			comm.send(inp, dest=i, tag=WORKTAG)
 
 		# As soon as a Slave is available, the Master assigns it a new image to process
@@ -36,10 +41,11 @@ def master(toProcess, pathsOutput, population, generations, selection, cross_rat
 			times[idx] = elapsed
 			idx += 1
 
-			inp = [toProcess[i-1], pathsOutput[i-1], population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose]
+			inp = [toProcess[i-1], pathsOutput[i-1], population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose, options]
 			comm.send(inp, dest=im_free, tag=WORKTAG)
 
-		for i in range(size, n+1):
+		# Collecting the last image of each Slave
+		for i in range(1, size):
 			im_free, elapsed = comm.recv(source=MPI.ANY_SOURCE, tag=10, status=status)
 			times[idx] = elapsed
 			idx += 1
@@ -48,7 +54,7 @@ def master(toProcess, pathsOutput, population, generations, selection, cross_rat
 	# only n Slaves are used
 	else:
 		for i in range(0, n):
-			inp = [toProcess[i], pathsOutput[i], population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose]
+			inp = [toProcess[i], pathsOutput[i], population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose, options]
 			comm.send(inp, dest=i+1, tag=WORKTAG)
 
 		for i in range(0, n):
@@ -76,14 +82,18 @@ def slave():
 			start = time.time()
 
 			# Enhancify execution on the input image by using the provided GA settings
-			enhancify = Enhancify(inp[0], inp[1])
-			enhancify.startGA(inp[2], inp[3], inp[4], inp[5], inp[6], inp[7], inp[8])
+			# The GA runs once for the images with the same histogram (inp[0] and inp[1] are the images and output folders of a group)
+			result = enhanceGroup(inp[0], inp[1], inp[2], inp[3], inp[4], inp[5], inp[6], inp[7], inp[8], **inp[10])
 
 			end = time.time()
 			elapsed = end-start
 
 			if inp[9]:
-				sys.stdout.write(" * Analyzed image %s"%inp[0])
+				sys.stdout.write(" * Analyzed image %s"%inp[0][0])
+				if len(inp[0]) > 1:
+					sys.stdout.write(" (and %d images with the same histogram)"%(len(inp[0]) - 1))
+				if inp[10]["cacheSize"] > 0:
+					sys.stdout.write(" -> Fitness cache: %d hits, %d misses" % result.cacheStatistics)
 				sys.stdout.write(" -> Elapsed time %5.2fs on rank %d\n\n" % (elapsed, rank))
 
 		if status.Get_tag():
@@ -104,7 +114,13 @@ if __name__ == '__main__':
 	mut_rate    = float(sys.argv[7])
 	elitism     = int(sys.argv[8])
 	pressure    = int(sys.argv[9])
-	verbose     = bool(sys.argv[10])
+	verbose     = sys.argv[10] == 'True'
+
+	# Options of Enhancify.startGA (completed by Enhancify.py)
+	options     = json.loads(sys.argv[11])
+
+	# Grouping the images with the same histogram, which are processed by a single GA run
+	dedup       = len(sys.argv) <= 12 or sys.argv[12] == 'True'
 
 	comm = MPI.COMM_WORLD
 	rank = comm.Get_rank()
@@ -164,6 +180,12 @@ if __name__ == '__main__':
 			sys.stdout.write( "   -> Number of generations: %d\n"%generations)
 			sys.stdout.write( "   -> Crossover rate: %.2f\n"%cross_rate)
 			sys.stdout.write( "   -> Mutation rate:  %.2f\n"%mut_rate)
+			sys.stdout.write( "   -> Fitness cache size: %d\n"%options["cacheSize"])
+			sys.stdout.write( "   -> Seed: %s\n"%options["seed"])
+			sys.stdout.write( "   -> Fitness workers: %d\n"%options["fitnessWorkers"])
+			if options["islands"] > 1:
+				sys.stdout.write( "   -> Islands: %d (%s topology), %d migrants every %d generations\n"%(options["islands"], options["topology"],
+				                                                                                     options["migrants"], options["migrationInterval"]))
 
 			if selection == 'wheel':
 				sys.stdout.write( "   -> Selection: wheel roulette\n\n\n")
@@ -177,7 +199,7 @@ if __name__ == '__main__':
 			if not os.path.exists(folderOut):
 				os.makedirs(folderOut)
 
-			for i in xrange(len(toProcess)):
+			for i in range(len(toProcess)):
 
 				# Output folders
 				string    = toProcess[i].split("/")[1:]
@@ -194,7 +216,15 @@ if __name__ == '__main__':
 			sys.stdout.write(" * Enhancify is using %d cores\n\n\n" % (size))
 
 		startAll = time.time()
-		times = master(toProcess, pathsOutput, population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose)
+
+		# Each Slave receives a group of images (with the same histogram, when dedup is True)
+		if dedup and len(toProcess) > 1:
+			groups = processing().groupByHistogram(toProcess, options["histogramCache"])
+		else:
+			groups = [[i] for i in range(len(toProcess))]
+
+		times = master([[toProcess[j] for j in group] for group in groups], [[pathsOutput[j] for j in group] for group in groups],
+					   population, generations, selection, cross_rate, mut_rate, elitism, pressure, verbose, options)
 
 	# Slave process
 	else:
@@ -205,11 +235,14 @@ if __name__ == '__main__':
 		endAll     = time.time()
 		elapsedAll = endAll-startAll
 
+		if options["metrics"] and len(toProcess) > 0:
+			aggregateMetrics(pathsOutput, folderOut)
+
 		if len(toProcess) == 0:
 			sys.stdout.write("******************************************************************************************\n")
 
 		if verbose and len(toProcess) > 0:
 			if len(toProcess) > 1:
-				sys.stdout.write("\n * Total elapsed time %5.2fs for computing %d images\n" % (elapsedAll, len(toProcess)))
-				sys.stdout.write(" * Mean elapsed time  %5.2fs per image\n" % (np.mean(times)))
+				sys.stdout.write("\n * Total elapsed time %5.2fs for computing %d images (%d GA runs)\n" % (elapsedAll, len(toProcess), len(groups)))
+				sys.stdout.write(" * Mean elapsed time  %5.2fs per GA run\n" % (np.mean(times)))
 				sys.stdout.write("******************************************************************************************\n")
\ No newline at end of file
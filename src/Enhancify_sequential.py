@@ -1,26 +1,65 @@
 import os
-import random as rnd
+import shutil
 import numpy as np
-from copy import deepcopy
-import sys
 import time
+import cProfile
 
-from src.GA import chromosome
 from src.GA import geneticOperation
+from src.GA import population
+from src.fitness import fitnessCache
+from src.parallelFitness import parallelEvaluator
+from src.islands import runIslands
+from src.traces import traceWriter
+from src.checkpoint import saveCheckpoint, loadCheckpoint
 from src.imageProcessing import processing
+from src.metrics import runMetrics
+from src.library import openLibrary
+
+# Default settings of a run besides the GA settings (options of Enhancify.startGA). The runners, the library API,
+# the islands and the daemon pass a dictionary with some of these entries, which is completed by runOptions
+defaultOptions = {
+	# Fitness evaluation
+	"cacheSize": 10000, "seed": None, "fitnessWorkers": 1, "sparse": None, "levelBinning": 1,
+	# Island model (migration is the exchange of an island, set by runIslands)
+	"islands": 1, "migrationInterval": 10, "topology": 'ring', "migrants": 2, "migration": None,
+	# Outputs
+	"traceFormat": 'text', "traceFlush": 100, "figures": True, "metrics": False, "profile": False, "histogramCache": None,
+	# Checkpoints
+	"checkpointInterval": 0, "resume": False,
+	# Stopping criteria
+	"stagnation": 0, "epsilon": 0.0, "targetFitness": None, "timeBudget": 0,
+	# Warm start (sequence mode)
+	"initialMapping": None, "perturbation": 0.02, "reuseDistance": 0.0,
+	# Solution library
+	"library": None, "librarySeeds": 5, "libraryFraction": 0.1,
+}
+
+# Options of a run: the provided options completed with the default ones (an unknown option raises TypeError)
+def runOptions(options=None):
+
+	options = {} if options is None else options
+
+	unknown = sorted(set(options) - set(defaultOptions))
+	if len(unknown) > 0:
+		raise TypeError("Unknown options of Enhancify.startGA: " + ", ".join(unknown))
+
+	completed = dict(defaultOptions)
+	completed.update(options)
+
+	return completed
 
 # Class containing Enhancify
+# The input is either the path of an image or an image already in memory (image), in which case pathInput can be None
+# When pathOutput is None nothing is written to disk: the results are available through the getter methods
 class Enhancify(object):
 
-	def __init__(self, pathInput, pathOutput):
+	def __init__(self, pathInput, pathOutput, image = None):
 
 		self.__pathIn	= pathInput
 		self.__pathOut	= pathOutput
+		self.__image	= image
 
 		self.__outputName 	 	= None
-		self.__outputNameFit 	= None
-		self.__outputNameThresh	= None
-		self.__outputNameTerms	= None
 		self.__outputNameInfo	= None
 
 		self.__childrenPerGen 	= None
@@ -28,29 +67,133 @@ class Enhancify(object):
 		self.__minGrayLevel		= None
 		self.__maxGrayLevel		= None
 		self.__targetMatrix		= None
+		self.__initialBest		= None
+		self.__maxValue			= None
+		self.__levelBinning		= 1
+		self.__sparse			= False
+		self.__figures			= True
 		self.__targetHist		= None
 		self.__noZeroPosHist	= None
-
-
-	def startGA(self, pop_size, numGen, selection, cross_rate, mut_rate, elitism, numberIndTour, minGL = 1):
+		self.__cache			= None
+		self.__rng				= None
+		self.__evaluator		= None
+		self.__migration		= None
+		self.__islandStatistics	= None
+		self.__trace			= None
+		self.__checkpoint		= None
+		self.__checkpointInterval	= 0
+		self.__settings			= None
+		self.__stagnation		= 0
+		self.__epsilon			= 0.0
+		self.__targetFitness	= None
+		self.__timeBudget		= 0
+		self.__startTime		= None
+		self.__metrics			= None
+		self.__saveMetrics		= False
+		self.__best				= None
+		self.__reason			= None
+		self.__initialMapping	= None
+		self.__perturbation		= 0.02
+		self.__reused			= False
+		self.__library			= None
+		self.__libraryRange		= None
+		self.__librarySeeds		= 5
+		self.__libraryFraction	= 0.1
+
+
+	# Running the GA on the image with the provided GA settings; options contains the other settings of the run
+	# (see defaultOptions), whose missing entries take the default values
+	def startGA(self, pop_size, numGen, selection, cross_rate, mut_rate, elitism, numberIndTour, minGL = 1, options = None):
+
+		options = runOptions(options)
+
+		if self.__pathOut is None and (options["islands"] > 1 or options["checkpointInterval"] > 0 or options["resume"]):
+			raise ValueError("The island model and the checkpoints require an output folder")
+
+		# Island model: the islands run this method on separate processes
+		if options["islands"] > 1:
+			args = (pop_size, numGen, selection, cross_rate, mut_rate, elitism, numberIndTour, minGL)
+			islandOptions = dict(options, islands=1, checkpointInterval=0, resume=False)
+			_, self.__islandStatistics = runIslands(self.__pathIn, self.__pathOut, args, islandOptions, options["islands"], options["migrationInterval"], options["topology"], options["migrants"])
+			return
+
+		self.__startTime = time.time()
+		self.__migration = options["migration"]
+		self.__figures	 = options["figures"]
+
+		# Stopping criteria: stagnation of the best fitness for a number of generations (improvements not larger than epsilon),
+		# target fitness and maximum wall-clock seconds (each one is disabled when it is 0 or None)
+		self.__stagnation		= options["stagnation"]
+		self.__epsilon			= options["epsilon"]
+		self.__targetFitness	= options["targetFitness"]
+		self.__timeBudget		= options["timeBudget"]
+
+		# When resuming, a run that has already been completed is not repeated
+		checkpoint = None if self.__pathOut is None else self.__pathOut + os.sep + 'checkpoint.npz'
+		if options["resume"] and os.path.exists(self.__pathOut + os.sep + 'matrixBest') and not os.path.exists(checkpoint):
+			return
+
+		# Instrumentation of the run (written into metrics.json and metrics.csv when metrics is True)
+		# and profiling of the whole run with cProfile (written into profile.prof when profile is True)
+		self.__metrics = runMetrics()
+		self.__saveMetrics = options["metrics"]
+		tick = self.__metrics.tick()
+
+		profiler = None
+		if options["profile"]:
+			profiler = cProfile.Profile()
+			profiler.enable()
 
 		# Image Processing object
 		imPros = processing()
 		
 		# Paths used to save the images and other information
-		self.__outputNameInfo = self.__pathOut + os.sep + 'information'
-		
-		self.__outputName 	  = self.__pathOut + os.sep + 'images'
-		
-		if not os.path.exists(self.__outputName):
-			os.makedirs(self.__outputName)
-
-		self.__outputNameFit	= self.__pathOut + os.sep + "fitness"
-		self.__outputNameThresh	= self.__pathOut + os.sep + "threshold"
-		self.__outputNameTerms	= self.__pathOut + os.sep + "terms"
-
-		# Reading the input image
-		self.__targetMatrix, numberGrayLevel, self.__targetHist, self.__noZeroPosHist, maxValueGray, T_k  = imPros.loadImage(self.__pathIn, self.__outputName )
+		if self.__pathOut is not None:
+			self.__outputNameInfo = self.__pathOut + os.sep + 'information'
+			
+			self.__outputName 	  = self.__pathOut + os.sep + 'images'
+			
+			if not os.path.exists(self.__outputName):
+				os.makedirs(self.__outputName)
+
+		# Per-generation records of the best individual (fitness, threshold and terms)
+		self.__trace = traceWriter(self.__pathOut, options["traceFlush"], options["traceFormat"])
+
+		# Reading the histogram of the input image (possibly from the histogram cache); the image itself is decoded
+		# only when the enhanced images are saved, together with imageOriginal.png whatever the state of the cache
+		if self.__image is not None:
+			self.__targetMatrix, numberGrayLevel, self.__targetHist, self.__noZeroPosHist, maxValueGray, T_k  = imPros.imageHistogram(np.asarray(self.__image))
+		else:
+			self.__targetMatrix, numberGrayLevel, self.__targetHist, self.__noZeroPosHist, maxValueGray, T_k  = imPros.loadHistogram(self.__pathIn, None, options["histogramCache"])
+
+		# High bit depth images: the GA can work on bins of levelBinning consecutive gray levels
+		self.__maxValue		= maxValueGray
+		self.__levelBinning	= options["levelBinning"]
+		if options["levelBinning"] > 1:
+			self.__targetHist		= imPros.binHistogram(self.__targetHist, options["levelBinning"])
+			self.__noZeroPosHist	= list(np.nonzero(self.__targetHist)[0])
+			numberGrayLevel			= len(self.__noZeroPosHist)
+			maxValueGray			= type(maxValueGray)(len(self.__targetHist) - 1)
+
+		# Range of the gray levels of the data type in the space of the GA, over which the histograms are compared by the library
+		self.__libraryRange	= (int(np.iinfo(self.__targetDtype()).max) + options["levelBinning"]) // options["levelBinning"] - 1
+
+		# Sparse histograms are used by default for the images with more than 256 gray levels
+		self.__sparse = bool(maxValueGray > 255) if options["sparse"] is None else options["sparse"]
+
+		# Warm start from the mapping of a previous run (e.g., the previous frame of a sequence), which is reused
+		# without running the GA when the histograms differ by less than reuseDistance
+		self.__initialMapping	= options["initialMapping"]
+		self.__perturbation		= options["perturbation"]
+		self.__reused			= options["initialMapping"] is not None and options["reuseDistance"] > 0 and imPros.histogramDistance(self.__targetHist, options["initialMapping"]["hist"]) < options["reuseDistance"]
+		if self.__reused:
+			pop_size, numGen, elitism = 1, 1, 1
+
+		# Library of the solutions of the previous runs: a fraction libraryFraction of the initial population is seeded
+		# from the librarySeeds solutions whose histograms are the nearest ones (the sequence mode has priority)
+		self.__library			= None if options["library"] is None else openLibrary(options["library"])
+		self.__librarySeeds		= options["librarySeeds"]
+		self.__libraryFraction	= options["libraryFraction"]
 
 		# GA settings
 		self.__childrenPerGen 	= pop_size - elitism # number of new individuals for each generation
@@ -58,157 +201,410 @@ class Enhancify(object):
 		self.__minGrayLevel		= minGL
 		self.__maxGrayLevel		= maxValueGray
 
+		# Single random number generator used by the whole GA, seeded for reproducible runs
+		self.__rng = np.random.default_rng(options["seed"])
+
+		# Checkpoint of the GA state, saved every checkpointInterval generations (disabled when it is 0)
+		self.__checkpoint			= checkpoint
+		self.__checkpointInterval	= options["checkpointInterval"]
+		self.__settings				= {"pop_size": pop_size, "elitism": elitism, "numberOfGenes": int(self.__numberOfGenes), "minGL": minGL, "maxGrayLevel": int(self.__maxGrayLevel)}
+
+		state = None
+		if options["resume"]:
+			state = loadCheckpoint(self.__checkpoint, self.__settings)
+			if state is None:
+				print("Warning: no valid checkpoint in " + self.__pathOut + ", the GA starts from the first generation")
+
+		# Fitness cache (disabled when its size is 0)
+		if options["cacheSize"] > 0:
+			self.__cache = fitnessCache(options["cacheSize"])
+
+		# Pool of processes evaluating chunks of the population in parallel
+		if options["fitnessWorkers"] > 1:
+			self.__evaluator = parallelEvaluator(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__maxGrayLevel, pop_size+1, options["fitnessWorkers"], sparse=self.__sparse)
+
+		tick = self.__metrics.add('load', tick)
+
 		# Saving the used GA settings
-		with open(self.__outputNameInfo, "w") as fo:
-			fo.write("******************************************************\n")
-			fo.write("\t\t\t GA settings\n\n")
-			fo.write("Number of chromosome: " + str(pop_size) + "\n")
-			fo.write("Number of elite chromosomes: " + str(elitism) + "\n")
-			fo.write("Number of genes: " + str(self.__numberOfGenes) + "\n")
-			fo.write("Number of generations: " + str(numGen) + "\n")
-			fo.write("Crossover rate: " + str(cross_rate) + "\n")
-			fo.write("Mutation rate:  " + str(mut_rate) + "\n")
+		self.__writeInformation(["******************************************************",
+								 "\t\t\t GA settings\n",
+								 "Number of chromosome: " + str(pop_size),
+								 "Number of elite chromosomes: " + str(elitism),
+								 "Number of genes: " + str(self.__numberOfGenes),
+								 "Number of generations: " + str(numGen),
+								 "Crossover rate: " + str(cross_rate),
+								 "Mutation rate:  " + str(mut_rate),
+								 "Fitness cache size: " + str(options["cacheSize"]),
+								 "Seed: " + str(options["seed"]),
+								 "Fitness workers: " + str(options["fitnessWorkers"]),
+								 "Trace format: " + options["traceFormat"],
+								 "Fitness histograms: " + ("sparse" if self.__sparse else "dense"),
+								 "Level binning: " + str(options["levelBinning"]),
+								 "Checkpoint interval: " + str(options["checkpointInterval"]),
+								 "Stagnation: " + str(options["stagnation"]) + " generations (epsilon " + str(options["epsilon"]) + ")",
+								 "Target fitness: " + str(options["targetFitness"]),
+								 "Time budget: " + str(options["timeBudget"]) + " seconds"], mode="w")
+		if options["initialMapping"] is not None:
+			self.__writeInformation(["Initial population: " + ("reused mapping" if self.__reused else "warm start (perturbation " + str(options["perturbation"]) + ")")])
+		if options["library"] is not None:
+			self.__writeInformation(["Solution library: " + options["library"] + " (" + str(len(self.__library)) + " solutions)"])
+		if state is not None:
+			self.__writeInformation(["Resumed from generation: " + str(state['generation'])])
 			
-		pop = []
+		try:
+			# Initialization of the GA instance
+			if state is None:
+				pop = self.__initialize(pop_size, mut_rate, T_k)
+				firstGen = 1
+			else:
+				pop = self.__restore(state, pop_size)
+				firstGen = state['generation'] + 1
 
-		# Initialization of the GA instance
-		pop = self.__initialize(pop, pop_size, mut_rate, T_k)
+			self.__metrics.count('evaluations', pop.evaluations)
+			self.__metrics.add('initialization', tick)
 
-		# Evolution of the GA 
-		pop = self.__evolve(pop, cross_rate, mut_rate, numGen, elitism, T_k, method=selection, numberInd = numberIndTour)
+			# Evolution of the GA 
+			pop = self.__evolve(pop, cross_rate, mut_rate, numGen, elitism, T_k, method=selection, numberInd = numberIndTour, firstGen = firstGen)
 
+			# The run is complete, the checkpoint is no longer needed
+			if self.__checkpoint is not None and os.path.exists(self.__checkpoint):
+				os.remove(self.__checkpoint)
 
-	# Initializing the population
-	def __initialize(self, pop, pop_size, mut_rate, T_k):
+			# The best solution is added to the library (the islands only use it, since each one has a partial solution)
+			if self.__library is not None and not self.__reused and self.__migration is None:
+				self.__library.add(self.__targetHist, self.__best.genes.copy(), float(self.__best.getFitness()), self.__libraryRange)
+
+		finally:
+			self.__trace.close()
+
+			if self.__evaluator is not None:
+				self.__evaluator.close()
+				self.__evaluator = None
+
+			if profiler is not None:
+				profiler.disable()
+				if self.__pathOut is not None:
+					profiler.dump_stats(self.__pathOut + os.sep + 'profile.prof')
+
+		if self.__cache is not None:
+			self.__writeInformation(["Fitness cache: " + str(self.__cache.hits) + " hits, " + str(self.__cache.misses) + " misses"])
 
-		for i in range(pop_size):
-			pop.append(chromosome(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, mut_rate, T_k))
+		if options["metrics"] and self.__pathOut is not None:
+			self.__metrics.save(self.__pathOut, self.getCacheStatistics())
+
+	# Appending lines to the information file (nothing is written when there is no output folder)
+	def __writeInformation(self, lines, mode = "a"):
+
+		if self.__pathOut is None:
+			return
+
+		with open(self.__outputNameInfo, mode) as fo:
+			for line in lines:
+				fo.write(line + "\n")
+
+	# Hits and misses of the fitness cache
+	def getCacheStatistics(self):
+		if self.__islandStatistics is not None:
+			return self.__islandStatistics
+		if self.__cache is None:
+			return 0, 0
+		return self.__cache.hits, self.__cache.misses
+
+	# Fitness value of the best individual found
+	def getBestFitness(self):
+		fitness, _, _ = self.__trace.getRecords()
+		return fitness[-1]
+
+	# Per-generation records of the best individual: fitness values, thresholds and terms
+	def getTraces(self):
+		return self.__trace.getRecords()
+
+	# Reason for stopping the GA (e.g., "maximum number of generations", "stagnation" or "reused mapping")
+	def getStoppingReason(self):
+		return self.__reason
+
+	# Mapping of the best individual in the space of the GA (non-zero gray levels or bins, genes and histogram),
+	# which can be used as initialMapping of another run; a reused mapping is returned unchanged
+	def getMapping(self):
+
+		if self.__reused:
+			return self.__initialMapping
+
+		return {"noZeroPosHist": np.asarray(self.__noZeroPosHist), "genes": self.__best.genes.copy(), "hist": self.__targetHist}
+
+	# Lookup table of the best individual found, mapping each original gray level to its enhanced level
+	def getLookupTable(self):
+
+		lut = self.__lookupTable(self.__best)
+		if lut is None:
+			lut = self.__best.getLookupTable(self.__noZeroPosHist, len(self.__targetHist)-1, self.__targetDtype())
+
+		return lut
+
+	# Enhanced image obtained by the best individual found (the input image is decoded if needed)
+	def getEnhancedImage(self):
+
+		if self.__targetMatrix is None:
+			self.__targetMatrix = processing().openImage(self.__pathIn)
+
+		return processing().applyLookupTable(self.__targetMatrix, self.getLookupTable())
+
+
+	# Initializing the population
+	def __initialize(self, pop_size, mut_rate, T_k):
+
+		pop = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, pop_size, self.__cache, self.__evaluator, self.__sparse)
+		solutions = []
+		if self.__initialMapping is None and self.__library is not None and self.__librarySeeds > 0:
+			solutions = self.__library.nearest(self.__targetHist, self.__libraryRange, self.__librarySeeds)
+
+		if self.__initialMapping is not None:
+			genes = processing().transferMapping(self.__initialMapping["hist"], self.__initialMapping["genes"], self.__targetHist, self.__minGrayLevel, self.__maxGrayLevel)
+			pop.initializeFrom(self.__rng, genes, self.__perturbation)
+		elif len(solutions) > 0:
+			genes = [processing().transferMapping(hist, seed, self.__targetHist, self.__minGrayLevel, self.__maxGrayLevel) for _, hist, seed, _ in solutions]
+			pop.initializeFrom(self.__rng, genes, self.__perturbation, max(len(genes), int(round(self.__libraryFraction * pop_size))))
+			self.__writeInformation(["Library seeds: " + str(len(genes)) + " (nearest distance " + str(solutions[0][0]) + ")"])
+		else:
+			pop.initialize(self.__rng)
+		pop.evaluate()
 
 		# Sorting the population based on the fitness values
-		pop.sort(key=lambda x: x.getFitness())
+		pop.sort()
 
-		pop[0].saveCurrentImage(self.__targetHist, self.__noZeroPosHist, self.__targetMatrix, self.__outputName + os.sep + 'image0.png', self.__outputName + os.sep+ 'imageConf0.png')
+		# The best initial individual is kept to save its image at the end of the run
+		self.__initialBest = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, 1)
+		self.__initialBest.copyFrom(pop, [0])
 
-		with open(self.__outputNameFit , "w") as fo:
-			fo.write(str(pop[0].getFitness()) + "\n")
+		best = pop.getChromosome(0)
+		self.__trace.append(best.getFitness(), best.getOpt_T(), pop.terms[0])
 
-		with open(self.__outputNameThresh , "w") as fo:
-			fo.write(str(pop[0].getOpt_T()) + "\n")
+		return pop
 
-		pop[0].saveTermFitness(self.__outputNameTerms, "w")
+	# Restoring the population, the random number generator and the traces saved into a checkpoint
+	def __restore(self, state, pop_size):
+
+		pop = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, pop_size, self.__cache, self.__evaluator, self.__sparse)
+		pop.genes[:]   = state['genes']
+		pop.fitness[:] = state['fitness']
+		pop.opt_T[:]   = state['opt_T']
+		pop.terms[:]   = state['terms']
+
+		self.__initialBest = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, 1)
+		self.__initialBest.genes[0] = state['initialBest']
+
+		self.__rng.bit_generator.state = state['rngState']
+		self.__trace.restore(state['traceFitness'], state['traceThreshold'], state['traceTerms'])
 
 		return pop
 
 	# Evolution of the population
-	def __evolve(self, pop, cross_rate, mut_rate, numGen, elitism, T_k, method = 'wheel', numberInd = 10):
+	def __evolve(self, pop, cross_rate, mut_rate, numGen, elitism, T_k, method = 'wheel', numberInd = 10, firstGen = 1):
 
 		n = len(pop)
-		with open(self.__outputNameInfo, "a") as fo:
-			if method == 'wheel':
-				fo.write("Selection: wheel roulette\n")
-			elif method == 'ranking':
-				fo.write("Selection: ranking \n")
-			else:
-				fo.write("Selection: tournament with " + str(numberInd) + " individuals\n")
-
-		op = geneticOperation()
+		if method == 'wheel':
+			self.__writeInformation(["Selection: wheel roulette"])
+		elif method == 'ranking':
+			self.__writeInformation(["Selection: ranking "])
+		else:
+			self.__writeInformation(["Selection: tournament with " + str(numberInd) + " individuals"])
+
+		op = geneticOperation(self.__rng)
+
+		# Each pair of parents generates two children; when the number of new individuals is odd,
+		# only the best child of the latest pair is kept
+		numPairs = (self.__childrenPerGen + 1) // 2
+		children = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, 2*numPairs, self.__cache, self.__evaluator, self.__sparse)
+		child_1  = children.genes[0::2]
+		child_2  = children.genes[1::2]
+		childT   = np.zeros(2*numPairs, dtype=int)
+		parents  = np.zeros(2*numPairs, dtype=int)
+
+		# Double buffering: each new generation is assembled in nextPop and sorted back into the buffer of the parents
+		nextPop  = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, n)
+		elites   = np.arange(elitism)
+		rows     = np.arange(self.__childrenPerGen)
+
+		# Best fitness of the latest improvement and number of generations since then (recomputed from the traces of a resumed run)
+		reference, stagnant = np.inf, 0
+		for fitness in self.__trace.getRecords()[0]:
+			reference, stagnant = (fitness, 0) if fitness < reference - self.__epsilon else (reference, stagnant + 1)
+
+		reason = "reused mapping" if self.__reused else "maximum number of generations"
 		
-		# The population evolves for (numGen-1) generations
-		for i in range(1, numGen):
-
-			# Roulette wheel selection
-			if method == 'wheel':
-				probabilities = []
-				for j in range(0, n):
-					probabilities.append(pop[j].getFitness())
-				sum_fit = np.sum(probabilities)
-
-				for j in range(0, n):
-					probabilities[j] = (probabilities[j]) / (sum_fit * 1.0)
-
-				probabilities = (1 - np.array(probabilities))
-				probabilities /= np.sum(probabilities)
-
-			# Ranking selection
-			elif method == 'ranking':
-				probabilities = []
-				rank = np.linspace(1, n, n)
-				rank = rank[::-1]
-				probabilities = rank / float(np.sum(rank))
-
-			# New individuals
-			countWhile = self.__childrenPerGen
-			children = []
-
-			while(countWhile > 0):
-
-				# Tournament selection
-				if method == 'tournament':
-					dist1 = np.random.randint(0, n, numberInd)
-					dist2 = np.random.randint(0, n, numberInd)
-
-					individuals1 = []
-					individuals2 = []
-					for k in range(numberInd):
-						individuals1.append(pop[dist1[k]])
-						individuals2.append(pop[dist2[k]])
-	
-					individuals1.sort(key=lambda x: x.getFitness())
-					individuals2.sort(key=lambda x: x.getFitness())
-
-					parent_1 = individuals1[0]
-					parent_2 = individuals2[0]
-
-				# Roulette wheel or ranking selection
-				else:
-					parent_1 = np.random.choice(pop, p=probabilities)
-					parent_2 = np.random.choice(pop, p=probabilities)
-				
-				# The latest individual is the best children
-				if (countWhile == 1):
-					child0 = chromosome(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, mut_rate, T_k, parent_1=parent_1, parent_2=parent_2)
-					child1 = deepcopy(chromosome(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, mut_rate, T_k, parent_1=parent_1, parent_2=parent_2, cross_point=child0.crossPoint))
-
-					if child0.getFitness() < child1.getFitness():
-						children.append(child0)
-					else:
-						children.append(child1)
-						countWhile = countWhile - 1
-
-				# Crossover
-				elif (rnd.uniform(0, 1) < cross_rate):
-					child0 = chromosome(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, mut_rate, T_k, parent_1=parent_1, parent_2=parent_2)
-					children.append(child0)
-					child1 = deepcopy(chromosome(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, mut_rate, T_k, parent_1=parent_1, parent_2=parent_2, cross_point=child0.crossPoint))
-					children.append(child1)
-					countWhile = countWhile - 2
-
-				# Parents without crossover
-				else:
-					op.mutate(parent_1.genes, self.__minGrayLevel, self.__maxGrayLevel, parent_1.getOpt_T(), mut_rate)
-					op.mutate(parent_2.genes, self.__minGrayLevel, self.__maxGrayLevel, parent_2.getOpt_T(), mut_rate)
-					parent_1.calculateFitness(self.__targetHist, self.__noZeroPosHist, self.__maxGrayLevel, self.__minGrayLevel)
-					parent_2.calculateFitness(self.__targetHist, self.__noZeroPosHist, self.__maxGrayLevel, self.__minGrayLevel)
-					children.append(parent_1)
-					children.append(parent_2)
-					countWhile = countWhile-2
+		# The population evolves for (numGen-1) generations (a resumed run starts after the generation of its checkpoint)
+		for i in range(firstGen, numGen):
+
+			tick = self.__metrics.startGeneration()
+			evaluations = children.evaluations
+
+			# Indices of the parents of each pair, drawn at once for the whole generation (wheel roulette, ranking or tournament selection)
+			parents_1, parents_2 = op.selectParents(pop.fitness, numPairs, method, numberInd)
+			tick = self.__metrics.add('selection', tick)
+
+			# Crossover is always applied to the latest pair when it generates the best child only
+			crossover = self.__rng.random(numPairs) < cross_rate
+			if self.__childrenPerGen % 2 == 1:
+				crossover[-1] = True
+
+			cross_points = self.__rng.integers(0, self.__numberOfGenes, numPairs)
+
+			# Crossover (the parents without crossover are copied into the children unchanged)
+			op.crossoverPopulation(pop.genes[parents_1], pop.genes[parents_2], cross_points, crossover, out=(child_1, child_2))
+			tick = self.__metrics.add('crossover', tick)
+
+			# Mutation: the children are mutated without a threshold, while the parents without crossover use their own threshold
+			childT[:] = 0
+			childT[0::2][~crossover] = pop.opt_T[parents_1[~crossover]]
+			childT[1::2][~crossover] = pop.opt_T[parents_2[~crossover]]
+
+			mutated = op.mutate(children.genes, self.__minGrayLevel, self.__maxGrayLevel, childT, mut_rate)
+			children.genes.sort(axis=1)
+			tick = self.__metrics.add('mutation', tick)
+
+			# The parents without crossover that have not been mutated keep their fitness values
+			parents[0::2] = parents_1
+			parents[1::2] = parents_2
+			unchanged = ~(np.repeat(crossover, 2) | np.any(mutated, axis=1))
+
+			children.fitness[unchanged] = pop.fitness[parents[unchanged]]
+			children.opt_T[unchanged]   = pop.opt_T[parents[unchanged]]
+			children.terms[unchanged]   = pop.terms[parents[unchanged]]
+
+			children.evaluate(np.flatnonzero(~unchanged))
+			tick = self.__metrics.add('evaluation', tick)
+
+			# The latest individual is the best children
+			if self.__childrenPerGen % 2 == 1:
+				rows[-1] = 2*numPairs - 1 if children.fitness[-1] <= children.fitness[-2] else 2*numPairs - 2
 
 			# Elitism to keep the best individual(s) during the evolution
-			pop[elitism:n] = deepcopy(children[0:self.__childrenPerGen])
+			nextPop.copyFrom(pop, elites)
+			nextPop.copyFrom(children, rows, start=elitism)
+
+			# Sorting the new generation based on the fitness values; the parents are no longer needed
+			nextPop.sort(out=pop)
+			tick = self.__metrics.add('replacement', tick)
+
+			# Island model: exchanging the best individuals with the other islands
+			if self.__migration is not None and i % self.__migration.interval == 0:
+				self.__migration.exchange(pop)
+				tick = self.__metrics.add('migration', tick)
+
+			best = pop.getChromosome(0)
+
+			self.__trace.append(best.getFitness(), best.getOpt_T(), pop.terms[0])
+
+			if self.__checkpointInterval > 0 and i % self.__checkpointInterval == 0 and i < numGen - 1:
+				saveCheckpoint(self.__checkpoint, pop, i, self.__rng, self.__trace, self.__settings, self.__initialBest.genes[0])
+			tick = self.__metrics.add('trace', tick)
+
+			# Stopping criteria
+			if best.getFitness() < reference - self.__epsilon:
+				reference, stagnant = best.getFitness(), 0
+			else:
+				stagnant += 1
+
+			stop = None
+			if self.__targetFitness is not None and best.getFitness() <= self.__targetFitness:
+				stop = "target fitness"
+			elif self.__timeBudget > 0 and time.time() - self.__startTime >= self.__timeBudget:
+				stop = "time budget"
+			elif self.__stagnation > 0 and stagnant >= self.__stagnation:
+				stop = "stagnation"
+
+			# The islands stop together at a migration generation, otherwise the others would wait for their migrants
+			if self.__migration is not None:
+				stop = self.__migration.agree(stop) if i % self.__migration.interval == 0 else None
+
+			self.__metrics.add('stopping', tick)
+			self.__metrics.count('evaluations', children.evaluations - evaluations)
+			self.__metrics.addGeneration(i, children.evaluations - evaluations, best.getFitness())
+
+			if stop is not None and i < numGen - 1:
+				reason = stop
+				break
+
+		self.__reason = reason
+		self.__writeInformation(["Stopping criterion: " + reason + " (generation " + str(len(self.__trace) - 1) + ")"])
+
+		# The best individual is copied, since the buffers of the population can be reused by another run
+		self.__best = population(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, 1)
+		self.__best.copyFrom(pop, [0])
+		self.__best = self.__best.getChromosome(0)
+
+		if self.__pathOut is not None:
+			tick = self.__metrics.tick()
+			if self.__targetMatrix is None:
+				self.__targetMatrix = processing().openImage(self.__pathIn)
+			processing().saveOriginal(self.__targetMatrix, self.__outputName, self.__pathIn)
+			self.__saveImages(pop.getChromosome(0), self.__targetMatrix, self.__outputName, self.__pathOut)
+			self.__metrics.add('output', tick)
+
+		return pop
+
+	# Saving the images of the best initial and final individuals applied to targetMatrix
+	# The comparison figures (imageConf0.png and imageConfBest.png) are drawn only when figures is True
+	def __saveImages(self, best, targetMatrix, outputName, pathOut):
+
+		nameConf0	 = outputName + os.sep+ 'imageConf0.png' if self.__figures else None
+		nameConfBest = outputName + os.sep + 'imageConfBest.png' if self.__figures else None
+
+		initialBest = self.__initialBest.getChromosome(0)
+		initialBest.saveCurrentImage(self.__targetHist, self.__noZeroPosHist, targetMatrix, outputName + os.sep + 'image0.png', nameConf0, lut=self.__lookupTable(initialBest))
+
+		best.saveCurrentImage(self.__targetHist, self.__noZeroPosHist, targetMatrix, outputName + os.sep + 'imageBest.png', nameConfBest, lut=self.__lookupTable(best))
+
+		# Colour images and stacks are saved with one row for each row of the image
+		matrix = best.getMatrix()
+		np.savetxt(pathOut + os.sep + 'matrixBest', matrix.reshape(matrix.shape[0], -1), fmt='%d')
+
+	# Saving the results of this run for another image with the same histogram (e.g., a duplicated tile or a repeated acquisition):
+	# its images are enhanced by the same mappings, while the traces and the information are copied from this run
+	# False is returned when the results are not available (e.g., island model or run completed before resuming)
+	# When the metrics are saved, the metrics of the image only measure the output and are marked as deduplicated
+	def saveDuplicate(self, pathInput, pathOutput):
+
+		if self.__best is None or self.__pathOut is None or self.__reused:
+			return False
+
+		metrics = runMetrics()
+		tick = metrics.tick()
+
+		outputName = pathOutput + os.sep + 'images'
+		if not os.path.exists(outputName):
+			os.makedirs(outputName)
+
+		self.__saveImages(self.__best, processing().readImage(pathInput, outputName), outputName, pathOutput)
+
+		for name in ['fitness', 'threshold', 'terms', 'trace.npz']:
+			if os.path.exists(self.__pathOut + os.sep + name):
+				shutil.copy(self.__pathOut + os.sep + name, pathOutput + os.sep + name)
+
+		with open(self.__outputNameInfo) as fi:
+			lines = [line for line in fi.read().splitlines() if not line.startswith("Identical histogram: ")]
+
+		with open(pathOutput + os.sep + 'information', "w") as fo:
+			for line in lines:
+				fo.write(line + "\n")
+			fo.write("Result: GA run of " + self.__pathIn + " (identical histogram)\n")
+
+		self.__writeInformation(["Identical histogram: " + pathInput])
 
-			# Sorting the population based on the fitness values
-			pop.sort(key=lambda x: x.getFitness())
+		if self.__saveMetrics:
+			metrics.add('output', tick)
+			metrics.save(pathOutput, source=self.__pathIn)
 
-			with open(self.__outputNameFit , "a") as fo:
-				fo.write(str(pop[0].getFitness()) + "\n")
+		return True
 
-			with open(self.__outputNameThresh , "a") as fo:
-				fo.write(str(pop[0].getOpt_T()) + "\n")
+	# Lookup table of the original gray levels (None: the lookup table of the genes)
+	def __lookupTable(self, best):
 
-			pop[0].saveTermFitness(self.__outputNameTerms, "a")
+		if self.__levelBinning == 1:
+			return None
 
-			if i == numGen - 1:
-				pop[0].saveCurrentImage(self.__targetHist, self.__noZeroPosHist, self.__targetMatrix, self.__outputName + os.sep + 'imageBest.png', self.__outputName + os.sep + 'imageConfBest.png')
+		return processing().buildInterpolatedLookupTable(self.__noZeroPosHist, best.genes, self.__levelBinning, self.__maxValue, self.__targetDtype())
 
-				np.savetxt(self.__pathOut + os.sep + 'matrixBest', pop[0].getMatrix(), fmt='%d')
-		return pop
\ No newline at end of file
+	# Data type of the gray levels of the input image (maxValue has the type of the pixels)
+	def __targetDtype(self):
+		return np.asarray(self.__maxValue).dtype
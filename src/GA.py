@@ -1,301 +1,333 @@
-import random as rnd
 import numpy as np
-import math
-import scipy.misc
-from copy import deepcopy
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import imageio
+
+from src.imageProcessing import processing
+from src.fitness import remapHistograms, fitnessFromHistograms, calculateFitnessBatch, calculateFitnessCached
 
 # Class containing the chromosome (individual) structure
+# Each chromosome is a view over a row of a population; the genes are the new positions of the non-zero bins
 class chromosome(object):
     
-    def __init__(self, targetHist, noZeroPosHist, numberOfGenes, minGrayLevel, maxGrayLevel, mut_rate, T_k, parent_1=None, parent_2=None, cross_point=None):
+    def __init__(self, targetHist, noZeroPosHist, numberOfGenes, minGrayLevel, maxGrayLevel, mut_rate, T_k, parent_1=None, parent_2=None, cross_point=None, pop=None, index=0, rng=None):
         
-        self.genes      = []
         self.crossPoint = None
-        self.__fitness  = None
-        self.__opt_T    = 0
         self.__hist     = None
         self.__matrix   = None
-        self.__term1    = None
-        self.__term2    = None
-        self.__term3    = None
 
-        if parent_1 and parent_2:
-            op = geneticOperation()
-            self.genes, self.crossPoint = op.crossoverUniform(parent_1, parent_2, cross_point)
-            op.mutate(self.genes, minGrayLevel, maxGrayLevel, self.__opt_T, mut_rate)
+        # Stand-alone chromosomes own a population made of a single individual
+        if pop is None:
+            pop = population(targetHist, noZeroPosHist, numberOfGenes, minGrayLevel, maxGrayLevel, 1)
+
+            if rng is None:
+                rng = np.random.default_rng()
+
+            if parent_1 and parent_2:
+                op = geneticOperation(rng)
+                genes, self.crossPoint = op.crossoverUniform(parent_1, parent_2, cross_point)
+                op.mutate(genes, minGrayLevel, maxGrayLevel, 0, mut_rate)
+                pop.genes[0] = np.sort(genes)
+            else:
+                pop.genes[0] = self.__generateUniformDistribution(noZeroPosHist, minGrayLevel, maxGrayLevel, rng)
+
+            self.__pop   = pop
+            self.__index = index
+            self.calculateFitness(targetHist, noZeroPosHist, maxGrayLevel, minGrayLevel)
 
         else:
+            self.__pop   = pop
+            self.__index = index
 
-            dist = self.__generateUniformDistribution(noZeroPosHist, minGrayLevel, maxGrayLevel)
+    @property
+    def genes(self):
+        return self.__pop.genes[self.__index]
 
-            for i in range(0, numberOfGenes):
-                self.genes.append(gene(dist[i]))
-        
-        self.genes.sort(key=lambda x: x.position)
-        self.__fitness, self.__opt_T, self.__hist = self.calculateFitness(targetHist, noZeroPosHist, maxGrayLevel, minGrayLevel)
+    @genes.setter
+    def genes(self, values):
+        self.__pop.genes[self.__index] = values
 
-    def __generateUniformDistribution(self, noZeroPosHist, minGrayLevel, maxGrayLevel):
+    def __generateUniformDistribution(self, noZeroPosHist, minGrayLevel, maxGrayLevel, rng):
 
-        dist1 =  np.random.uniform(minGrayLevel, maxGrayLevel, len(noZeroPosHist))
+        dist1 =  rng.uniform(minGrayLevel, maxGrayLevel, len(noZeroPosHist))
         dist = [int(round(j)) for j in dist1]
         return sorted(dist)
 
-    def __calculateVariances(self, hist, opt_T, mu1, mu2):
+    # Gray level transformation encoded by the genes as a dense lookup table
+    def getLookupTable(self, noZeroPosHist, maxGrayLevel, dtype=np.int64):
+        return processing().buildLookupTable(noZeroPosHist, self.genes, maxGrayLevel, dtype)
+
+    # The enhanced image is obtained by applying the lookup table to the target image,
+    # optionally in tiles of tileRows rows to bound the memory used for huge images
+    # A different lookup table (e.g., interpolated from binned gray levels) can be provided by lut
+    # The comparison figure is not drawn when f_nameConf is None; matplotlib and imageio are imported only when needed
+    def saveCurrentImage(self, targetHist, noZeroPosHist, targetMatrix, f_name, f_nameConf, tileRows=None, lut=None):
+
+        if lut is None:
+            lut = self.getLookupTable(noZeroPosHist, len(targetHist)-1, targetMatrix.dtype)
+        self.__matrix = processing().applyLookupTable(targetMatrix, lut, tileRows=tileRows)
+
+        if f_nameConf is not None:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+
+            plt.figure()
+            plt.subplot(121)
+            plt.imshow(targetMatrix, cmap='Greys_r')
+            plt.subplot(122)
+            plt.imshow(self.__matrix, cmap='Greys_r')
+            plt.tight_layout()
+            plt.savefig(f_nameConf)
+            plt.close()
+
+        import imageio
+        imageio.imwrite(f_name, self.__matrix)
 
-        noZeroPosHist = np.nonzero(hist)[0]
+    def saveTermFitness(self, file, mod):
+        term1, term2, term3 = self.__pop.terms[self.__index]
+        with open(file, mod) as fo:
+            fo.write(str(term1) + "\t")
+            fo.write(str(term2) + "\t")
+            fo.write(str(term3) + "\n")
 
-        val1 = noZeroPosHist[0]
-        val2 = noZeroPosHist[0]
-        pos = 0
-        for i in range(1, len(noZeroPosHist)):
-            if noZeroPosHist[i] <= opt_T:
-                val2 = noZeroPosHist[i]
-                pos = i
-            else:
-                break
-
-        val3 = noZeroPosHist[pos+1]
-        val4 = noZeroPosHist[-1]
-
-        halfWidth1 = (val2 - val1) / 2.0
-        halfWidth2 = (val4 - val3) / 2.0
-
-        countOcc1 = 0
-        acc1 = 0
-        countOcc2 = 0
-        acc2 = 0
-        for i in range(len(noZeroPosHist)):
-            greyLev = noZeroPosHist[i]
-            if greyLev <= opt_T:
-                countOcc1 += hist[greyLev]
-                acc1 += (hist[greyLev] * (greyLev - mu1)**2)
-            else:
-                countOcc2 += hist[greyLev]
-                acc2 += (hist[greyLev] * (greyLev - mu2)**2)                
+    # Both the methods accumulate the occurrences of the bins moved onto the same gray level
+    def calculateFitness(self, targetHist, noZeroPosHist, maxGrayLevel, minGrayLevel, method = 'reverse'):
 
-        std1 = math.sqrt((acc1 / (float(countOcc1))))
-        std2 = math.sqrt((acc2 / (float(countOcc2))))
+        genes = self.genes
+        if np.min(genes) < minGrayLevel or np.max(genes) > maxGrayLevel:
+            print ('idx', genes[(genes < minGrayLevel) | (genes > maxGrayLevel)][0])
+            exit()
 
-        return std1, std2, halfWidth1, halfWidth2
+        hist = remapHistograms(genes, targetHist, noZeroPosHist, maxGrayLevel)
+        fitness, opt_T, terms = fitnessFromHistograms(hist)
 
-    def __optimalThreshold(self, hist_vals, delta_T, max_it):
+        # The results are stored in the row of the population
+        self.__hist = hist[0]
+        self.__pop.fitness[self.__index] = fitness[0]
+        self.__pop.opt_T[self.__index]   = opt_T[0]
+        self.__pop.terms[self.__index]   = terms[0]
 
-        # Initializing the output value
-        opt_T = 1
-    
-        # Initializing the threshold to the global mean
-        h_dim = len(hist_vals)
-        total_pixel_number = np.sum(hist_vals)
-        weighted_hist_sum = 0
-        for i in range(0, h_dim):
-            weighted_hist_sum = weighted_hist_sum + hist_vals[i] * (i-1)
-        
-        hist_mean = weighted_hist_sum / (total_pixel_number*1.0)
-        
-        # If the histogram mean is equal to 0, the procedure ends  
-        if hist_mean == 0:
-            return opt_T
-    
-        # Threshold at step k
-        T_k = 0
-        
-        # Threshold at step k+1
-        T_k1 = int(math.floor(hist_mean))
-        
-        # Iteration counter
-        counter = 1
-        
-        while counter < max_it:
-            if (T_k1 - T_k) <= delta_T:
-                break
-            
-            # Updating the threshold
-            T_k = T_k1
-            
-            # Splitting the histogram H into two sub-histograms H1 and H2 by means of the threshold T_k
-            H1_pixel_number = 0
-            H2_pixel_number = 0
-            for i in range(0, T_k):
-                H1_pixel_number += hist_vals[i]
-            for i in range((T_k+1), h_dim):
-                H2_pixel_number += hist_vals[i]
-                            
-            weighted_H1_sum = 0
-            for i in range(0, T_k):
-                weighted_H1_sum = weighted_H1_sum + hist_vals[i] * (i-1)
-            
-            weighted_H2_sum = 0
-            for i in range((T_k+1), h_dim):
-                weighted_H2_sum = weighted_H2_sum + hist_vals[i] * (i-1)
-            
-            # Mean value of the sub-histogram H1
-            H1_mean = weighted_H1_sum / (H1_pixel_number*1.0)
-            
-            # Mean value of the sub-histogram H2
-            H2_mean = weighted_H2_sum / (H2_pixel_number*1.0)
-            
-            # Updating the threshold at step k+1 (T_k1)
-            T_k1 = int(math.floor((H1_mean + H2_mean) / 2.0))
-            counter = counter + 1
-            
-        return T_k, H1_mean, H2_mean
-
-    def saveCurrentImage(self, targetHist, noZeroPosHist, targetMatrix, f_name, f_nameConf):
-
-        self.__matrix = deepcopy(targetMatrix)
-        newNoZeros = []
-        for i in range(0, len(self.genes)):
-            newNoZeros.append(self.genes[i].position)
-
-        for i in range(0, len(noZeroPosHist)):
-            ind = noZeroPosHist[i]
-            pos = np.where(targetMatrix == ind);
-            
-            pos_x = pos[0]
-            pos_y = pos[1]
-            for j in range(0, len(pos_x)):
-               self.__matrix[pos_x[j]][pos_y[j]] = newNoZeros[i]
-
-        plt.figure()
-        plt.subplot(121)
-        plt.imshow(targetMatrix, cmap='Greys_r')
-        plt.subplot(122)
-        plt.imshow(self.__matrix, cmap='Greys_r')
-        plt.tight_layout()
-        plt.savefig(f_nameConf)
-        plt.close()
+        return fitness[0], opt_T[0], self.__hist
 
-        imageio.imwrite(f_name, self.__matrix)
+    def getFitness(self):
+        return self.__pop.fitness[self.__index]
 
-    def saveTermFitness(self, file, mod):
-        with open(file, mod) as fo:
-            fo.write(str(self.__term1) + "\t")
-            fo.write(str(self.__term2) + "\t")
-            fo.write(str(self.__term3) + "\n")
+    def getOpt_T(self):
+        return self.__pop.opt_T[self.__index]
 
-    def calculateFitness(self, targetHist, noZeroPosHist, maxGrayLevel, minGrayLevel, method = 'reverse'):
+    def getMatrix(self):
+        return self.__matrix
 
-        hist = [0]*(maxGrayLevel+1)
-
-        if method == 'reverse':
-            oldIdx = self.genes[-1].position
-            for i in range(len(noZeroPosHist)-1, -1, -1):
-                idx = self.genes[i].position
-                if idx < minGrayLevel or idx > maxGrayLevel:
-                    print ('idx', idx)
-                    exit()
-                ind = noZeroPosHist[i]
-                if idx == oldIdx:
-                    hist[idx] += targetHist[ind]
-                else:
-                    hist[idx] = targetHist[ind]
-                    oldIdx = self.genes[i].position
-        
-        elif method == 'direct':
-            oldIdx = self.genes[0].position
-            for i in range(0, len(noZeroPosHist)):
-                idx = self.genes[i].position
-                if idx < minGrayLevel or idx > maxGrayLevel:
-                    print ('idx', idx)
-                    exit()
-                ind = noZeroPosHist[i]
-                if idx == oldIdx:
-                    hist[idx] += targetHist[ind]
-                else:
-                    hist[idx] = targetHist[ind]
-                    oldIdx = self.genes[i].position
+# Class containing the whole population as a matrix of genes (individuals x genes) and the vectors of the fitness values
+# An optional fitnessCache avoids evaluating again the individuals already seen,
+# while an optional parallelEvaluator distributes the evaluations over a pool of processes
+# When sparse is True, the fitness is calculated on sparse histograms (high bit depth images)
+class population(object):
 
-        opt_T, mu1, mu2 = self.__optimalThreshold(hist, 0.001, 100)
+    def __init__(self, targetHist, noZeroPosHist, numberOfGenes, minGrayLevel, maxGrayLevel, size, cache=None, evaluator=None, sparse=False):
 
-        sigma1, sigma2, halfWidth1, halfWidth2= self.__calculateVariances(hist, opt_T, mu1, mu2)
+        self.__targetHist    = targetHist
+        self.__noZeroPosHist = noZeroPosHist
+        self.__numberOfGenes = numberOfGenes
+        self.__minGrayLevel  = minGrayLevel
+        self.__maxGrayLevel  = maxGrayLevel
+        self.__cache         = cache
+        self.__evaluator     = evaluator
+        self.__sparse        = sparse
 
-        self.__term1 = abs(2*opt_T - mu1 - mu2)
-        self.__term2 = abs( halfWidth1*0.33 - sigma1 )
-        self.__term3 = abs( halfWidth2*0.33 - sigma2 )
+        self.genes   = np.zeros((size, numberOfGenes), dtype=np.int64)
+        self.fitness = np.zeros(size)
+        self.opt_T   = np.zeros(size, dtype=np.int64)
+        self.terms   = np.zeros((size, 3))
 
-        dist =  self.__term1 +  self.__term2 +  self.__term3
+        # Number of fitness values calculated (the individuals found in the cache are not counted)
+        self.evaluations = 0
 
-        return dist, opt_T, hist
+    def __len__(self):
+        return len(self.genes)
 
-    def getFitness(self):
-        return self.__fitness
+    # Random initialization: each individual is a sorted uniform distribution of gray levels
+    def initialize(self, rng):
 
-    def getOpt_T(self):
-        return self.__opt_T
+        dist = rng.uniform(self.__minGrayLevel, self.__maxGrayLevel, self.genes.shape)
+        self.genes[:] = np.sort(np.rint(dist), axis=1)
 
-    def getMatrix(self):
-        return self.__matrix
+    # Warm start (e.g., from the best individual of the previous frame of a sequence or from a library of solutions):
+    # the first individuals are the seeds (one row of genes for each seed), the others are copies of the seeds perturbed by a Gaussian noise
+    # whose standard deviation is perturbation times the range of gray levels
+    # When count is provided, only the first count individuals are seeded and the others are initialized at random
+    def initializeFrom(self, rng, genes, perturbation, count=None):
 
-# Class representing a gene of each individual      
-class gene(object):
-    
-    def __init__(self, pos = 0):
+        seeds = np.atleast_2d(genes)
+        count = len(self) if count is None else min(count, len(self))
 
-        # Each gene is a bin of the histogram
-        self.position = pos
-    
-    # Mutate the bin index
-    def mutatePosition(self, minGrayLevel, maxGrayLevel, opt_T):
+        if count < len(self):
+            self.initialize(rng)
+
+        noise = rng.normal(0, perturbation * (int(self.__maxGrayLevel) - self.__minGrayLevel), (count, self.__numberOfGenes))
+        noise[:len(seeds)] = 0
+
+        seeded = seeds[np.arange(count) % len(seeds)] + noise
+        self.genes[:count] = np.sort(np.clip(np.rint(seeded), self.__minGrayLevel, self.__maxGrayLevel), axis=1)
+
+    # Calculating the fitness values of the selected individuals (all the individuals by default)
+    def evaluate(self, rows=None):
 
-        if self.position <= opt_T:
-            value = rnd.randint(minGrayLevel, opt_T)
+        if rows is None:
+            rows = slice(None)
+
+        if self.__cache is not None:
+            misses = self.__cache.misses
+            fitness, opt_T, terms = calculateFitnessCached(self.genes[rows], self.__targetHist, self.__noZeroPosHist, self.__maxGrayLevel, self.__cache, self.__evaluator, self.__sparse)
+            self.evaluations += self.__cache.misses - misses
+        elif self.__evaluator is not None:
+            fitness, opt_T, terms = self.__evaluator.evaluate(self.genes[rows])
+            self.evaluations += len(fitness)
         else:
-            value = rnd.randint(opt_T, maxGrayLevel)
-        
-        if value > maxGrayLevel:
-            value = maxGrayLevel
-        elif value < minGrayLevel:
-            value = minGrayLevel
-        
-        self.position = value
+            fitness, opt_T, terms = calculateFitnessBatch(self.genes[rows], self.__targetHist, self.__noZeroPosHist, self.__maxGrayLevel, self.__sparse)
+            self.evaluations += len(fitness)
+
+        self.fitness[rows] = fitness
+        self.opt_T[rows]   = opt_T
+        self.terms[rows]   = terms
+
+    # Sorting the population based on the fitness values
+    # When out is provided, the sorted individuals are gathered into that population (e.g., a spare buffer) instead
+    def sort(self, out=None):
+
+        order = np.argsort(self.fitness, kind='stable')
+
+        if out is None:
+            self.genes   = self.genes[order]
+            self.fitness = self.fitness[order]
+            self.opt_T   = self.opt_T[order]
+            self.terms   = self.terms[order]
+            return self
+
+        out.copyFrom(self, order)
+        return out
+
+    # Copying the individuals in the rows of another population starting from the position start
+    # The rows are gathered directly into the arrays of this population, without temporary copies
+    def copyFrom(self, other, rows, start=0):
+
+        end = start + len(rows)
+
+        np.take(other.genes, rows, axis=0, out=self.genes[start:end])
+        np.take(other.fitness, rows, out=self.fitness[start:end])
+        np.take(other.opt_T, rows, out=self.opt_T[start:end])
+        np.take(other.terms, rows, axis=0, out=self.terms[start:end])
+
+    def getChromosome(self, index):
+        return chromosome(self.__targetHist, self.__noZeroPosHist, self.__numberOfGenes, self.__minGrayLevel, self.__maxGrayLevel, None, None, pop=self, index=index)
 
 # Class containing the genetic operators (i.e., crossover and mutation)            
+# All the random numbers are drawn from the provided numpy.random.Generator
 class geneticOperation(object):
 
+    def __init__(self, rng=None):
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        self.rng = rng
+
     # Mutation of the genes
+    # genes can be either a chromosome (1D) or a matrix of chromosomes (2D) with an opt_T value for each row
     def mutate(self, genes, minGrayLevel, maxGrayLevel, opt_T, rate):
-        
-        for i in range(0, len(genes)):
-            if rnd.uniform(0, 1) < rate:
-                genes[i].mutatePosition(minGrayLevel, maxGrayLevel, opt_T)
-                
+
+        genes = np.asarray(genes)
+        opt_T = np.asarray(opt_T)
+        if genes.ndim == 2:
+            opt_T = opt_T.reshape(-1, 1)
+
+        mask = self.rng.random(genes.shape) < rate
+        if not np.any(mask):
+            return mask
+
+        # Each mutated bin index is moved on the same side of the threshold
+        left  = genes <= opt_T
+        low   = np.where(left, minGrayLevel, opt_T)
+        high  = np.where(left, opt_T, maxGrayLevel)
+        value = self.rng.integers(low[mask], high[mask], endpoint=True)
+
+        genes[mask] = np.clip(value, minGrayLevel, maxGrayLevel)
+
+        return mask
+
+    # Indices of the parents of numPairs pairs, drawn at once from a population sorted by fitness
+    # Tournament selection: the best individual of a tournament is the one with the lowest index
+    def selectParents(self, fitness, numPairs, method='tournament', numberInd=10):
+
+        n = len(fitness)
+
+        if method == 'tournament':
+            parents_1, parents_2 = np.min(self.rng.integers(0, n, (2, numPairs, numberInd)), axis=2)
+            return parents_1, parents_2
+
+        # Roulette wheel selection
+        if method == 'wheel':
+            probabilities = fitness / (np.sum(fitness) * 1.0)
+            probabilities = (1 - probabilities)
+            probabilities /= np.sum(probabilities)
+
+        # Ranking selection
+        else:
+            rank = np.linspace(1, n, n)
+            rank = rank[::-1]
+            probabilities = rank / float(np.sum(rank))
+
+        parents_1, parents_2 = self.rng.choice(n, (2, numPairs), p=probabilities)
+
+        return parents_1, parents_2
+
     def crossoverSingle(self, parent_1, parent_2):
 
         numberGenes = len(parent_1.genes)
-        randNum = rnd.randint(0, numberGenes)
+        randNum = self.rng.integers(0, numberGenes, endpoint=True)
         
-        list1 = deepcopy(parent_1.genes[0:randNum])
-        list2 = deepcopy(parent_2.genes[randNum:numberGenes])
-
-        return list1 + list2
+        return np.concatenate((parent_1.genes[0:randNum], parent_2.genes[randNum:numberGenes]))
 
     # Uniform and circular crossover
     def crossoverUniform(self, parent_1, parent_2, cross_point):
 
+        numberGenes = len(parent_1.genes)
+
         # If the crossover point exists, it is used to mix the genes of the two parents
         if cross_point:
-            numberGenes = len(parent_1.genes)
-            list1 = []
-            half = int(round( numberGenes / 2.0))
-            if cross_point >= half:
-                list1 = deepcopy(parent_2.genes[0:cross_point-half]) + deepcopy(parent_1.genes[cross_point-half:cross_point]) + deepcopy(parent_2.genes[cross_point:numberGenes])
-            else:
-                list1 = deepcopy(parent_1.genes[0:cross_point]) + deepcopy(parent_2.genes[cross_point:cross_point+half]) + deepcopy(parent_1.genes[cross_point+half:numberGenes])
-            return list1, cross_point
+            child_1, _ = self.crossoverPopulation(parent_2.genes[np.newaxis], parent_1.genes[np.newaxis], [cross_point])
+            return child_1[0], cross_point
         
         # If the crossover point does not exist, it is randomly selected to mix the genes of the two parents
         else:
-            numberGenes = len(parent_1.genes)
-            randNum = rnd.randint(0, numberGenes-1)
-            list1 = []
-            half = int(round(numberGenes / 2.0))
-
-            if randNum >= half:
-                list1 = deepcopy(parent_1.genes[0:randNum-half]) + deepcopy(parent_2.genes[randNum-half:randNum]) + deepcopy(parent_1.genes[randNum:numberGenes]) 
-            else:
-                list1 = deepcopy(parent_2.genes[0:randNum]) + deepcopy(parent_1.genes[randNum:randNum+half]) + deepcopy(parent_2.genes[randNum+half:numberGenes])
-            return list1, randNum
\ No newline at end of file
+            randNum = self.rng.integers(0, numberGenes)
+            child_1, _ = self.crossoverPopulation(parent_1.genes[np.newaxis], parent_2.genes[np.newaxis], [randNum])
+            return child_1[0], randNum
+
+    # Uniform and circular crossover applied to each pair of rows of the two matrices of parents
+    # Two complementary children are generated for each pair by using the corresponding crossover point;
+    # the pairs whose crossover flag is False are copied unchanged. The children can be written into preallocated arrays (out)
+    def crossoverPopulation(self, parents_1, parents_2, cross_points, crossover=None, out=None):
+
+        numberGenes = parents_1.shape[1]
+        half = int(round(numberGenes / 2.0))
+        cross_points = np.asarray(cross_points).reshape(-1, 1)
+
+        # Window of half genes ending at the crossover point (or starting from it, when the point is in the first half)
+        upper = cross_points >= half
+        start = np.where(upper, cross_points-half, cross_points)
+        positions = np.arange(numberGenes)
+        window = (positions >= start) & (positions < start+half)
+
+        fromParent_2 = window == upper
+        if crossover is not None:
+            fromParent_2 &= np.asarray(crossover).reshape(-1, 1)
+
+        if out is None:
+            out = (np.empty_like(parents_1), np.empty_like(parents_2))
+        child_1, child_2 = out
+
+        np.copyto(child_1, parents_1)
+        np.copyto(child_1, parents_2, where=fromParent_2)
+        np.copyto(child_2, parents_2)
+        np.copyto(child_2, parents_1, where=fromParent_2)
+
+        return child_1, child_2
\ No newline at end of file
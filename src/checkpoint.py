@@ -0,0 +1,37 @@
+import os
+import json
+import numpy as np
+
+# Checkpoints of the GA: the whole state of a run (population, generation counter, random number generator,
+# traces and best initial individual) is stored into a single compressed npz file, so that the run can be resumed exactly where it stopped
+
+# The checkpoint is first written into a temporary file, which then replaces the previous checkpoint
+def saveCheckpoint(path, pop, generation, rng, trace, settings, initialBest):
+
+    traceFitness, traceThreshold, traceTerms = trace.getRecords()
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as fo:
+        np.savez_compressed(fo, genes=pop.genes, fitness=pop.fitness, opt_T=pop.opt_T, terms=pop.terms,
+                            generation=generation, rngState=json.dumps(rng.bit_generator.state),
+                            traceFitness=traceFitness, traceThreshold=traceThreshold, traceTerms=traceTerms,
+                            settings=json.dumps(settings), initialBest=initialBest)
+
+    os.replace(temporary, path)
+
+# Loading a checkpoint. None is returned when the checkpoint does not exist or was saved with different settings
+def loadCheckpoint(path, settings):
+
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        if json.loads(str(data['settings'])) != settings:
+            return None
+
+        state = {name: data[name] for name in data.files}
+
+    state['generation'] = int(state['generation'])
+    state['rngState']   = json.loads(str(state['rngState']))
+
+    return state
@@ -0,0 +1,81 @@
+import time
+import numpy as np
+
+from src.Enhancify_sequential import Enhancify
+
+# Library API of Enhancify: the image is either a NumPy array of integer gray levels or the path of an image file
+# Nothing is written to disk unless pathOutput is provided, in which case the outputs of the command line version
+# (images, traces, matrixBest and information) are saved into pathOutput, e.g.:
+#   result = enhance(array, 50, 100, seed=1)
+#   enhanced, lut = result.image, result.lut
+# The additional keyword arguments are the options of Enhancify.startGA (see Enhancify_sequential.defaultOptions)
+
+# Results of a run: enhanced image, gray-level mapping (lut[level] is the enhanced level of each original level),
+# fitness and threshold of the best individual, stopping reason, mapping in the space of the GA (see Enhancify.getMapping),
+# elapsed seconds and, optionally, the per-generation traces
+# The enhanced image is computed only when it is first accessed
+class enhancement(object):
+
+    def __init__(self, enhancify, traces=False):
+
+        self.__enhancify = enhancify
+        self.__image     = None
+
+        self.cacheStatistics = enhancify.getCacheStatistics()
+
+        # The island model writes its results into the output folder only
+        if enhancify.getStoppingReason() is None:
+            self.lut = self.fitness = self.threshold = self.reason = self.mapping = self.traces = None
+            return
+
+        fitness, threshold, terms = enhancify.getTraces()
+
+        self.lut       = enhancify.getLookupTable()
+        self.fitness   = float(fitness[-1])
+        self.threshold = int(threshold[-1])
+        self.reason    = enhancify.getStoppingReason()
+        self.mapping   = enhancify.getMapping()
+        self.traces    = {"fitness": fitness, "threshold": threshold, "terms": terms} if traces else None
+
+    # Saving this result for another image with the same histogram (see Enhancify.saveDuplicate)
+    def saveDuplicate(self, pathInput, pathOutput):
+        return self.__enhancify.saveDuplicate(pathInput, pathOutput)
+
+    @property
+    def image(self):
+
+        if self.__image is None and self.lut is not None:
+            self.__image = self.__enhancify.getEnhancedImage()
+
+        return self.__image
+
+# Enhancement of a single image by using the provided GA settings
+# When traces is True, the fitness values, thresholds and terms of the best individual of each generation are returned
+def enhance(image, pop_size=100, numGen=100, selection='tournament', cross_rate=0.9, mut_rate=0.01, elitism=1, numberIndTour=20,
+            traces=False, pathOutput=None, **options):
+
+    if isinstance(image, np.ndarray):
+        enhancify = Enhancify(None, pathOutput, image=image)
+    else:
+        enhancify = Enhancify(image, pathOutput)
+
+    start = time.time()
+    enhancify.startGA(pop_size, numGen, selection, cross_rate, mut_rate, elitism, numberIndTour, options=options)
+
+    result = enhancement(enhancify, traces)
+    result.elapsed = time.time() - start
+
+    return result
+
+# Enhancement of a group of image files with the same histogram (see processing.groupByHistogram), whose outputs are saved
+# into the corresponding folders of pathsOutput: the GA runs on the first image, and its mappings are applied to the others
+# The other images are processed independently when the results of the first one are not available (e.g., island model)
+def enhanceGroup(imagePaths, pathsOutput, pop_size=100, numGen=100, selection='tournament', cross_rate=0.9, mut_rate=0.01, elitism=1, numberIndTour=20, **options):
+
+    result = enhance(imagePaths[0], pop_size, numGen, selection, cross_rate, mut_rate, elitism, numberIndTour, pathOutput=pathsOutput[0], **options)
+
+    for imagePath, pathOutput in zip(imagePaths[1:], pathsOutput[1:]):
+        if not result.saveDuplicate(imagePath, pathOutput):
+            enhance(imagePath, pop_size, numGen, selection, cross_rate, mut_rate, elitism, numberIndTour, pathOutput=pathOutput, **options)
+
+    return result
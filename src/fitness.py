@@ -0,0 +1,219 @@
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+from src.thresholding import optimalThresholdBatch, optimalThresholdSparse
+
+# Fitness function of Enhancify, evaluated on a whole population at once
+# Each row of the gene matrix contains the new positions of the non-zero bins of the target histogram
+
+# Histograms obtained by moving the non-zero bins of the target histogram to the positions encoded by the genes
+def remapHistograms(genes, targetHist, noZeroPosHist, maxGrayLevel):
+
+    genes = np.atleast_2d(genes)
+    n = genes.shape[0]
+    levels = int(maxGrayLevel) + 1
+
+    # 2D bincount: the bins of each individual are shifted by the row offset
+    offsets = np.arange(n).reshape(-1, 1) * levels
+    counts = np.tile(np.asarray(targetHist)[noZeroPosHist], n)
+
+    hists = np.bincount((genes + offsets).ravel(), weights=counts, minlength=n*levels)
+
+    return hists.reshape(n, levels).astype(np.int64)
+
+# Standard deviations and half widths of the two modes separated by the threshold opt_T (one value for each row)
+def calculateVariancesBatch(hists, opt_T, mu1, mu2):
+
+    levels  = hists.shape[1]
+    greyLev = np.arange(levels)
+
+    noZero = hists > 0
+    left   = greyLev <= opt_T.reshape(-1, 1)
+
+    # Rank of each non-zero bin among the non-zero bins of its histogram
+    rank = np.cumsum(noZero, axis=1) - 1
+    pos  = np.maximum(np.sum(noZero & left, axis=1) - 1, 0)
+
+    val1 = np.argmax(noZero, axis=1)
+    val2 = np.argmax(noZero & (rank == pos.reshape(-1, 1)), axis=1)
+    val3 = np.argmax(noZero & (rank == pos.reshape(-1, 1) + 1), axis=1)
+    val4 = levels - 1 - np.argmax(noZero[:, ::-1], axis=1)
+
+    halfWidth1 = (val2 - val1) / 2.0
+    halfWidth2 = (val4 - val3) / 2.0
+
+    countOcc1 = np.sum(np.where(left, hists, 0), axis=1)
+    countOcc2 = np.sum(hists, axis=1) - countOcc1
+
+    acc1 = np.sum(np.where(left, hists * (greyLev - mu1.reshape(-1, 1))**2, 0), axis=1)
+    acc2 = np.sum(np.where(left, 0, hists * (greyLev - mu2.reshape(-1, 1))**2), axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std1 = np.sqrt(acc1 / (countOcc1 * 1.0))
+        std2 = np.sqrt(acc2 / (countOcc2 * 1.0))
+
+    return std1, std2, halfWidth1, halfWidth2
+
+# Fitness values, thresholds and the three terms of the fitness of each histogram
+def fitnessFromHistograms(hists):
+
+    opt_T, mu1, mu2 = optimalThresholdBatch(hists, 0.001, 100)
+
+    sigma1, sigma2, halfWidth1, halfWidth2 = calculateVariancesBatch(hists, opt_T, mu1, mu2)
+
+    return combineTerms(opt_T, mu1, mu2, sigma1, sigma2, halfWidth1, halfWidth2)
+
+# Fitness values and terms from the thresholds, means, standard deviations and half widths of the two modes
+def combineTerms(opt_T, mu1, mu2, sigma1, sigma2, halfWidth1, halfWidth2):
+
+    terms = np.empty((len(opt_T), 3))
+    terms[:, 0] = np.abs(2*opt_T - mu1 - mu2)
+    terms[:, 1] = np.abs(halfWidth1*0.33 - sigma1)
+    terms[:, 2] = np.abs(halfWidth2*0.33 - sigma2)
+
+    fitness = terms[:, 0] + terms[:, 1] + terms[:, 2]
+
+    return fitness, opt_T, terms
+
+# Same as calculateVariancesBatch on sparse histograms (sorted gray levels of the non-zero bins and their occurrences)
+def calculateVariancesSparse(levels, weights, opt_T, mu1, mu2):
+
+    n, k = levels.shape
+    rows = np.arange(n)
+
+    # Repeated gray levels are a single bin of the dense histogram
+    distinct = np.ones(levels.shape, dtype=bool)
+    distinct[:, 1:] = levels[:, 1:] != levels[:, :-1]
+
+    left = levels <= opt_T.reshape(-1, 1)
+
+    rank = np.cumsum(distinct, axis=1) - 1
+    pos  = np.maximum(np.sum(distinct & left, axis=1) - 1, 0)
+
+    third = distinct & (rank == pos.reshape(-1, 1) + 1)
+
+    val1 = levels[:, 0]
+    val2 = levels[rows, np.argmax(distinct & (rank == pos.reshape(-1, 1)), axis=1)]
+    val3 = np.where(np.any(third, axis=1), levels[rows, np.argmax(third, axis=1)], 0)
+    val4 = levels[:, -1]
+
+    halfWidth1 = (val2 - val1) / 2.0
+    halfWidth2 = (val4 - val3) / 2.0
+
+    countOcc1 = np.sum(np.where(left, weights, 0), axis=1)
+    countOcc2 = np.sum(weights, axis=1) - countOcc1
+
+    acc1 = np.sum(np.where(left, weights * (levels - mu1.reshape(-1, 1))**2, 0), axis=1)
+    acc2 = np.sum(np.where(left, 0, weights * (levels - mu2.reshape(-1, 1))**2), axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std1 = np.sqrt(acc1 / (countOcc1 * 1.0))
+        std2 = np.sqrt(acc2 / (countOcc2 * 1.0))
+
+    return std1, std2, halfWidth1, halfWidth2
+
+# Sparse version of calculateFitnessBatch for high bit depth images: since the genes of each row are sorted,
+# the remapped histogram is given by the genes and the occurrences of the non-zero bins of the target histogram,
+# so that neither dense histograms nor loops over all the gray levels are needed
+def calculateFitnessSparse(genes, targetHist, noZeroPosHist, maxGrayLevel):
+
+    levels  = np.atleast_2d(genes)
+    weights = np.broadcast_to(np.asarray(targetHist)[noZeroPosHist], levels.shape)
+
+    opt_T, mu1, mu2 = optimalThresholdSparse(levels, weights, int(maxGrayLevel) + 1, 0.001, 100)
+
+    sigma1, sigma2, halfWidth1, halfWidth2 = calculateVariancesSparse(levels, weights, opt_T, mu1, mu2)
+
+    return combineTerms(opt_T, mu1, mu2, sigma1, sigma2, halfWidth1, halfWidth2)
+
+# Fitness values, thresholds and terms of all the individuals of a gene matrix (sparse selects calculateFitnessSparse)
+def calculateFitnessBatch(genes, targetHist, noZeroPosHist, maxGrayLevel, sparse=False):
+
+    if sparse:
+        return calculateFitnessSparse(genes, targetHist, noZeroPosHist, maxGrayLevel)
+
+    hists = remapHistograms(genes, targetHist, noZeroPosHist, maxGrayLevel)
+
+    return fitnessFromHistograms(hists)
+
+# Bounded cache of the fitness values indexed by a hash of the genes, managed with a Least Recently Used (LRU) policy
+class fitnessCache(object):
+
+    def __init__(self, maxSize=10000):
+
+        self.maxSize = maxSize
+        self.hits    = 0
+        self.misses  = 0
+
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def key(self, genes):
+        return hashlib.blake2b(np.ascontiguousarray(genes).tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+
+        entry = self.__entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.__entries.move_to_end(key)
+            self.hits += 1
+
+        return entry
+
+    def put(self, key, entry):
+
+        self.__entries[key] = entry
+        self.__entries.move_to_end(key)
+
+        # Evicting the least recently used entry
+        if len(self.__entries) > self.maxSize:
+            self.__entries.popitem(last=False)
+
+# Same as calculateFitnessBatch, but only the individuals not stored in the cache are evaluated
+# Identical individuals of the same gene matrix are evaluated once, possibly by a parallelEvaluator
+def calculateFitnessCached(genes, targetHist, noZeroPosHist, maxGrayLevel, cache, evaluator=None, sparse=False):
+
+    genes = np.atleast_2d(genes)
+    n = genes.shape[0]
+
+    fitness = np.empty(n)
+    opt_T   = np.empty(n, dtype=np.int64)
+    terms   = np.empty((n, 3))
+
+    # Rows to be evaluated, grouped by key
+    missing = OrderedDict()
+
+    for i in range(n):
+        key = cache.key(genes[i])
+
+        if key in missing:
+            missing[key].append(i)
+            cache.hits += 1
+            continue
+
+        entry = cache.get(key)
+        if entry is None:
+            missing[key] = [i]
+        else:
+            fitness[i], opt_T[i], terms[i] = entry
+
+    if missing:
+        first = [rows[0] for rows in missing.values()]
+        if evaluator is None:
+            newFitness, newOpt_T, newTerms = calculateFitnessBatch(genes[first], targetHist, noZeroPosHist, maxGrayLevel, sparse)
+        else:
+            newFitness, newOpt_T, newTerms = evaluator.evaluate(genes[first])
+
+        for j, (key, rows) in enumerate(missing.items()):
+            fitness[rows] = newFitness[j]
+            opt_T[rows]   = newOpt_T[j]
+            terms[rows]   = newTerms[j]
+            cache.put(key, (newFitness[j], newOpt_T[j], newTerms[j].copy()))
+
+    return fitness, opt_T, terms
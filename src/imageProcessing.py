@@ -1,8 +1,9 @@
 import numpy as np
-import scipy.misc
-import math
 import os
-import imageio
+import shutil
+import hashlib
+
+from src.thresholding import optimalThreshold
 
 # Class containing image processing functions
 class processing(object):
@@ -10,81 +11,216 @@ class processing(object):
     # Loading the input image characterized an underlying bimodal histogram
     def loadImage(self, target_img_name, pathOut):
     
-        image = imageio.imread(target_img_name)
+        image = self.readImage(target_img_name, pathOut)
+            
+        return self.imageHistogram(image)
 
-        maxValue = np.max(image)
+    # Same outputs of loadImage for an image already in memory (e.g., a NumPy array provided by the library API)
+    def imageHistogram(self, image):
 
-        hist, _ = np.histogram(image, bins = maxValue+1)
+        if not np.issubdtype(image.dtype, np.integer):
+            raise ValueError("The image must contain integer gray levels, not " + str(image.dtype))
 
-        hist[0] = 0
+        hist, maxValue, T_k = self.calculateHistogram(image)
 
         posNoZeros = list(np.nonzero(hist)[0])
 
+        return image, len(posNoZeros), hist, posNoZeros, maxValue, T_k
+
+    # Opening the input image: uncompressed TIFF images are memory-mapped (when the optional tifffile is available),
+    # so that their pixels are read from disk only when they are accessed; the other images are decoded into memory
+    # The image libraries are imported only when an image is actually read
+    def openImage(self, target_img_name):
+
+        ext = target_img_name.split(".")[-1].lower()
+
+        if ext in ["tif", "tiff"]:
+            try:
+                import tifffile
+                return tifffile.memmap(target_img_name, mode='r')
+            except ImportError:
+                pass
+            except ValueError:
+                # Compressed or tiled images cannot be memory-mapped
+                pass
+
+        import imageio
+        return imageio.imread(target_img_name)
+
+    # Opening the input image, which is also saved into the output folder (when pathOut is not None)
+    def readImage(self, target_img_name, pathOut):
+
+        image = self.openImage(target_img_name)
+
+        if pathOut is not None:
+            self.saveOriginal(image, pathOut, target_img_name)
+
+        return image
+
+    # Saving the input image into the output folder as imageOriginal.png
+    # A memory-mapped image read from the file source is not decoded into memory: the file is copied block by block
+    # as imageOriginal with the extension of the source (e.g., imageOriginal.tif)
+    def saveOriginal(self, image, pathOut, source=None):
+
+        if source is not None and isinstance(image, np.memmap):
+            shutil.copyfile(source, pathOut + os.sep + 'imageOriginal' + os.path.splitext(source)[1].lower())
+            return
+
+        import imageio
         imageio.imwrite(pathOut + os.sep + 'imageOriginal.png', image)
 
-        T_k =  self.__optimalThreshold(hist, 0.001, 100)
-            
+    # Histogram of the image (without the background level 0), maximum gray level and initial threshold
+    # The occurrences of the gray levels are counted on chunks of chunkSize pixels, so that a memory-mapped image
+    # is streamed from disk without loading it entirely
+    # Signed images (e.g., int16 TIFF images) are accepted only when none of their gray levels is negative
+    def calculateHistogram(self, image, chunkSize=1 << 22):
+
+        pixels = image.reshape(-1)
+        signed = np.issubdtype(image.dtype, np.signedinteger)
+
+        hist = np.zeros(1, dtype=np.int64)
+        for start in range(0, pixels.size, chunkSize):
+            chunk = pixels[start:start+chunkSize]
+
+            if signed and chunk.min() < 0:
+                raise ValueError("The image contains negative gray levels (minimum " + str(chunk.min()) + "), which are not supported")
+
+            counts = np.bincount(chunk)
+
+            if len(counts) > len(hist):
+                hist = np.pad(hist, (0, len(counts) - len(hist)))
+            hist[:len(counts)] += counts
+
+        maxValue = image.dtype.type(len(hist) - 1)
+
+        hist[0] = 0
+
+        T_k, _, _ = optimalThreshold(hist, 0.001, 100)
+
+        return hist, maxValue, T_k
+
+    # Same outputs of loadImage, but the image is decoded only when its histogram is not in the cache folder (otherwise it is None)
+    # The entries of the cache are indexed by a hash of the content of the image file (cacheDir None disables the cache)
+    def loadHistogram(self, target_img_name, pathOut, cacheDir=None):
+
+        image = None
+        entry = None
+        if cacheDir is not None:
+            # The personalization string identifies how the histograms are computed, so that old entries are not reused
+            digest = hashlib.blake2b(digest_size=16, person=b'bincount')
+            with open(target_img_name, 'rb') as fi:
+                for block in iter(lambda: fi.read(1 << 20), b''):
+                    digest.update(block)
+
+            entry = cacheDir + os.sep + digest.hexdigest() + '.npz'
+
+        if entry is not None and os.path.exists(entry):
+            with np.load(entry) as data:
+                hist, maxValue, T_k = data['hist'], data['maxValue'][()], data['T_k'][()]
+
+        else:
+            image = self.readImage(target_img_name, pathOut)
+            hist, maxValue, T_k = self.calculateHistogram(image)
+
+            if entry is not None:
+                if not os.path.exists(cacheDir):
+                    os.makedirs(cacheDir, exist_ok=True)
+
+                # Written into a temporary file first, since several processes can share the cache folder
+                temporary = entry + '.%d.tmp' % os.getpid()
+                with open(temporary, 'wb') as fo:
+                    np.savez(fo, hist=hist, maxValue=maxValue, T_k=T_k)
+                os.replace(temporary, entry)
+
+        posNoZeros = list(np.nonzero(hist)[0])
+
         return image, len(posNoZeros), hist, posNoZeros, maxValue, T_k
 
-    # Efficient Iterative Optimal Threshold Selection (IOTS) algorithm
-    def __optimalThreshold(self, hist_vals, delta_T, max_it):
-            
-        # Initializing the output value
-        opt_T = 1
-    
-        # Initializing the threshold to the global mean
-        h_dim = len(hist_vals)
-        total_pixel_number = np.sum(hist_vals)
-        weighted_hist_sum = 0
-        for i in range(0, h_dim):
-            weighted_hist_sum = weighted_hist_sum + hist_vals[i] * (i-1)
-        
-        hist_mean = weighted_hist_sum / (total_pixel_number*1.0)
-        
-        # If the the histogram mean is equal to 0, the procedure ends  
-        if hist_mean == 0:
-            return opt_T
-    
-        # Threshold at step k
-        T_k = 0
-        
-        # Threshold at step k+1
-        T_k1 = int(math.floor(hist_mean))
-        
-        # Iteration counter
-        counter = 1
-        
-        while counter < max_it:
-            if (T_k1 - T_k) <= delta_T:
-                break
-            
-            # Updating the threshold
-            T_k = T_k1
-            
-            # Splitting the histogram H into two sub-histograms H1 and H2 by means of the threshold T_k
-            H1_pixel_number = 0
-            H2_pixel_number = 0
-            for i in range(0, T_k):
-                H1_pixel_number += hist_vals[i]
-            for i in range((T_k+1), h_dim):
-                H2_pixel_number += hist_vals[i]
-                            
-            weighted_H1_sum = 0
-            for i in range(0, T_k):
-                weighted_H1_sum = weighted_H1_sum + hist_vals[i] * (i-1)
-            
-            weighted_H2_sum = 0
-            for i in range((T_k+1), h_dim):
-                weighted_H2_sum = weighted_H2_sum + hist_vals[i] * (i-1)
-            
-            # Mean value of the sub-histogram H1
-            H1_mean = weighted_H1_sum / (H1_pixel_number*1.0)
-            
-            # Mean value of the sub-histogram H2
-            H2_mean = weighted_H2_sum / (H2_pixel_number*1.0)
-            
-            # Updating the threshold at step k+1 (T_k1)
-            T_k1 = int(math.floor((H1_mean + H2_mean) / 2.0))
-            counter = counter + 1
-            
-        return T_k
\ No newline at end of file
+    # Groups of images with the same histogram (e.g., duplicated tiles, repeated acquisitions or masked crops) as lists of indices,
+    # in order of first occurrence; the histograms are read through the histogram cache, which is filled for the GA runs
+    def groupByHistogram(self, target_img_names, cacheDir=None):
+
+        groups = {}
+        for index, name in enumerate(target_img_names):
+            _, _, hist, _, maxValue, _ = self.loadHistogram(name, None, cacheDir)
+
+            digest = hashlib.blake2b(np.ascontiguousarray(hist, dtype=np.int64).tobytes(), digest_size=16)
+            digest.update(str(np.asarray(maxValue).dtype).encode())
+
+            groups.setdefault(digest.hexdigest(), []).append(index)
+
+        return list(groups.values())
+
+    # Dense lookup table moving each non-zero gray level to the corresponding gene; the other levels are unchanged
+    def buildLookupTable(self, noZeroPosHist, genes, maxValue, dtype=np.int64):
+
+        lut = np.arange(int(maxValue)+1, dtype=dtype)
+        lut[noZeroPosHist] = genes
+
+        return lut
+
+    # Histogram with the gray levels grouped into bins of binSize consecutive levels (bin k contains the levels k*binSize, ..., (k+1)*binSize-1)
+    def binHistogram(self, hist, binSize):
+
+        levels = -(-len(hist) // binSize) * binSize
+
+        return np.pad(hist, (0, levels - len(hist))).reshape(-1, binSize).sum(axis=1)
+
+    # Lookup table of the original gray levels when the genes move the non-zero bins of a binned histogram:
+    # the centre of each bin is moved to the centre of its new bin, while the other levels are linearly interpolated
+    # The background level 0 is unchanged, as in buildLookupTable
+    def buildInterpolatedLookupTable(self, noZeroPosBins, genes, binSize, maxValue, dtype=np.int64):
+
+        centre = (binSize - 1) / 2.0
+
+        levels = np.arange(int(maxValue)+1)
+        lut = np.interp(levels, np.asarray(noZeroPosBins) * binSize + centre, np.asarray(genes) * binSize + centre)
+
+        lut = np.clip(np.rint(lut), 0, int(maxValue)).astype(dtype)
+        lut[0] = 0
+
+        return lut
+
+    # Genes of a mapping transferred onto the non-zero gray levels of another histogram (e.g., the next frame of a sequence)
+    # The levels are matched by quantile, so that a drift of the intensities between the histograms moves the mapping as well:
+    # each new level takes the gene interpolated at the level with the same cumulative fraction of pixels in histFrom
+    def transferMapping(self, histFrom, genes, histTo, minGrayLevel, maxGrayLevel):
+
+        transferred = np.interp(self.__midQuantiles(histTo), self.__midQuantiles(histFrom), genes)
+
+        return np.clip(np.rint(transferred), minGrayLevel, maxGrayLevel).astype(np.int64)
+
+    # Cumulative fraction of pixels at the centre of each non-zero bin of the histogram
+    def __midQuantiles(self, hist):
+
+        counts = np.asarray(hist)[np.nonzero(hist)[0]].astype(float)
+
+        return (np.cumsum(counts) - 0.5 * counts) / np.sum(counts)
+
+    # Total variation distance between the normalized histograms (0: same distribution of gray levels, 1: disjoint)
+    def histogramDistance(self, hist1, hist2):
+
+        levels = max(len(hist1), len(hist2))
+        p = np.pad(hist1, (0, levels - len(hist1))) / float(np.sum(hist1))
+        q = np.pad(hist2, (0, levels - len(hist2))) / float(np.sum(hist2))
+
+        return 0.5 * np.sum(np.abs(p - q))
+
+    # Applying the lookup table to the image with a single fancy-index pass
+    # When tileRows is provided, the image is processed in tiles of tileRows rows and the result is written into out
+    # (e.g., a memory-mapped array) without allocating any other full-size copy of the image
+    def applyLookupTable(self, image, lut, out=None, tileRows=None):
+
+        if tileRows is None and out is None:
+            return lut[image]
+
+        if out is None:
+            out = np.empty(image.shape, dtype=lut.dtype)
+
+        if tileRows is None:
+            tileRows = len(image)
+
+        for start in range(0, len(image), tileRows):
+            out[start:start+tileRows] = lut[image[start:start+tileRows]]
+
+        return out
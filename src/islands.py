@@ -0,0 +1,161 @@
+import os
+import queue
+import shutil
+import numpy as np
+from multiprocessing import Array, Barrier, Process, Queue
+
+# Island model of Enhancify: K sub-populations (islands) evolve independently on separate processes
+# and exchange their best chromosomes every interval generations
+
+# Reasons for stopping an island before the maximum number of generations (0: the island does not stop)
+stoppingReasons = (None, 'stagnation', 'target fitness', 'time budget')
+
+# Islands sending their migrants to each island
+def sourceIslands(index, islands, topology):
+
+    if topology == 'ring':
+        return [(index - 1) % islands]
+
+    # Fully connected topology
+    return [k for k in range(islands) if k != index]
+
+# Class exchanging the best individuals of an island with the other islands
+class islandMigration(object):
+
+    def __init__(self, index, islands, queues, interval, topology='ring', migrants=2, flags=None, barrier=None):
+
+        self.index    = index
+        self.interval = interval
+        self.migrants = migrants
+
+        self.__queues  = queues
+        self.__sources = sourceIslands(index, islands, topology)
+        self.__targets = [k for k in range(islands) if index in sourceIslands(k, islands, topology)]
+
+        # Stopping reasons of all the islands, shared to stop them at the same generation
+        self.__flags   = flags
+        self.__barrier = barrier
+
+    # The best individuals of the (sorted) population are sent to the target islands,
+    # while the immigrants replace the worst individuals of the population
+    def exchange(self, pop):
+
+        best = slice(0, self.migrants)
+        message = (pop.genes[best].copy(), pop.fitness[best].copy(), pop.opt_T[best].copy(), pop.terms[best].copy())
+
+        for k in self.__targets:
+            self.__queues[k].put(message)
+
+        received = [self.__queues[self.index].get() for k in self.__sources]
+
+        genes   = np.concatenate([m[0] for m in received])
+        fitness = np.concatenate([m[1] for m in received])
+        opt_T   = np.concatenate([m[2] for m in received])
+        terms   = np.concatenate([m[3] for m in received])
+
+        # The best individual of the island is never replaced
+        count = min(len(genes), len(pop) - 1)
+        worst = slice(len(pop) - count, len(pop))
+
+        pop.genes[worst]   = genes[:count]
+        pop.fitness[worst] = fitness[:count]
+        pop.opt_T[worst]   = opt_T[:count]
+        pop.terms[worst]   = terms[:count]
+
+        pop.sort()
+
+    # Common stopping decision of the islands, taken at the migration generations
+    # All the islands stop when one of them reaches the target fitness or its time budget, or when all of them stagnate
+    def agree(self, reason):
+
+        if self.__flags is None:
+            return reason
+
+        self.__flags[self.index] = stoppingReasons.index(reason)
+        self.__barrier.wait()
+        reasons = [stoppingReasons[code] for code in self.__flags]
+        self.__barrier.wait()
+
+        for common in ('target fitness', 'time budget'):
+            if common in reasons:
+                return common
+
+        if all(other == 'stagnation' for other in reasons):
+            return 'stagnation'
+
+        return None
+
+# Process running the GA of an island
+def island(index, pathInput, pathOutput, args, options, migration, results):
+
+    from src.Enhancify_sequential import Enhancify
+
+    enhancify = Enhancify(pathInput, pathOutput)
+    enhancify.startGA(*args, options=dict(options, migration=migration))
+
+    bestFitness = enhancify.getBestFitness()
+
+    results.put((index, bestFitness, enhancify.getCacheStatistics()))
+
+# Running the islands. Each island writes its outputs into pathOutput/islands/island_k;
+# the outputs of the best island are then copied into pathOutput
+def runIslands(pathInput, pathOutput, args, options, islands, interval, topology, migrants):
+
+    queues  = [Queue() for k in range(islands)]
+    results = Queue()
+    flags   = Array('i', islands)
+    barrier = Barrier(islands)
+
+    processes = []
+    paths = []
+    for k in range(islands):
+
+        path = pathOutput + os.sep + 'islands' + os.sep + 'island_%d' % k
+        if not os.path.exists(path):
+            os.makedirs(path)
+        paths.append(path)
+
+        # Each island uses its own stream of random numbers
+        islandOptions = dict(options)
+        if options.get('seed') is not None:
+            islandOptions['seed'] = [options['seed'], k]
+
+        migration = islandMigration(k, islands, queues, interval, topology, migrants, flags, barrier)
+        processes.append(Process(target=island, args=(k, pathInput, path, args, islandOptions, migration, results)))
+
+    for process in processes:
+        process.start()
+
+    outcomes = []
+    while len(outcomes) < islands:
+        try:
+            outcomes.append(results.get(timeout=1))
+        except queue.Empty:
+            # An island that fails would block the others at the next migration
+            if any(process.exitcode not in (None, 0) for process in processes):
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError("An island of " + pathInput + " terminated unexpectedly")
+
+    for process in processes:
+        process.join()
+
+    outcomes.sort()
+    best = min(outcomes, key=lambda x: x[1])[0]
+
+    for name in ['fitness', 'threshold', 'terms', 'trace.npz', 'matrixBest', 'information', 'metrics.json', 'metrics.csv', 'profile.prof']:
+        if os.path.exists(paths[best] + os.sep + name):
+            shutil.copy(paths[best] + os.sep + name, pathOutput + os.sep + name)
+    shutil.copytree(paths[best] + os.sep + 'images', pathOutput + os.sep + 'images', dirs_exist_ok=True)
+
+    hits   = sum(outcome[2][0] for outcome in outcomes)
+    misses = sum(outcome[2][1] for outcome in outcomes)
+
+    with open(pathOutput + os.sep + 'information', "a") as fo:
+        fo.write("Islands: " + str(islands) + " (" + topology + " topology)\n")
+        fo.write("Migration interval: " + str(interval) + " generations, " + str(migrants) + " migrants\n")
+        fo.write("Best island: " + str(best) + "\n")
+        for outcome in outcomes:
+            fo.write("Island " + str(outcome[0]) + " best fitness: " + str(outcome[1]) + "\n")
+
+    return best, (hits, misses)
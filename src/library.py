@@ -0,0 +1,121 @@
+import os
+import hashlib
+import numpy as np
+
+# Solution library of Enhancify: the best mapping of each completed run (histogram in the space of the GA, genes and fitness)
+# is stored into a folder, one npz file for each histogram, so that several processes can share the same library
+# The signature of a histogram is its cumulative distribution sampled at bins gray levels evenly spaced over a fixed range
+# (maxGrayLevel, e.g., the largest value of the data type), so that the L1 distance between two signatures approximates the
+# earth mover's distance between the histograms (0: same distribution, 1: farthest), whatever their largest gray levels
+# The solutions are transferred between histograms with different gray levels by processing.transferMapping
+# The nearest neighbours are found by a vectorized scan of the matrix of the signatures, which is kept in memory and
+# refreshed with the entries added by other processes
+
+# Libraries already opened by this process
+libraries = {}
+
+# Opening a library (the new entries written by other processes are loaded)
+def openLibrary(path, bins=64):
+
+    if path not in libraries:
+        libraries[path] = solutionLibrary(path, bins)
+
+    library = libraries[path]
+    library.refresh()
+
+    return library
+
+class solutionLibrary(object):
+
+    def __init__(self, path, bins=64):
+
+        self.path = path
+        self.bins = bins
+
+        self.__names      = []
+        self.__loaded     = set()
+        self.__signatures = np.zeros((0, bins))
+        self.__fitness    = np.zeros(0)
+
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self.__names)
+
+    # Signature of a histogram: cumulative distribution at bins gray levels evenly spaced between 1 and maxGrayLevel
+    # (the background level 0 is excluded, and the distribution is 1 beyond the largest gray level of the histogram)
+    def signature(self, hist, maxGrayLevel):
+
+        cdf = np.cumsum(hist[1:]) / float(np.sum(hist[1:]))
+
+        return np.interp(np.linspace(1, maxGrayLevel, self.bins), np.arange(1, len(hist)), cdf)
+
+    # Loading the entries added since the latest refresh
+    def refresh(self):
+
+        names = sorted(name for name in os.listdir(self.path) if name.endswith('.npz') and name not in self.__loaded)
+        if len(names) == 0:
+            return
+
+        signatures, fitness = [], []
+        for name in names:
+            with np.load(self.path + os.sep + name) as data:
+                # The entries written without their range are compared over the range of their own histogram
+                maxGrayLevel = int(data['maxGrayLevel']) if 'maxGrayLevel' in data else len(data['hist']) - 1
+                signatures.append(self.signature(data['hist'], maxGrayLevel))
+                fitness.append(float(data['fitness']))
+
+        self.__names      += names
+        self.__loaded     |= set(names)
+        self.__signatures  = np.vstack([self.__signatures] + signatures)
+        self.__fitness     = np.concatenate([self.__fitness, fitness])
+
+    # Adding the solution of a histogram (signature over the range maxGrayLevel); an existing solution of the same histogram
+    # is replaced only by a better one
+    def add(self, hist, genes, fitness, maxGrayLevel):
+
+        digest = hashlib.blake2b(np.ascontiguousarray(hist, dtype=np.int64).tobytes(), digest_size=16).hexdigest()
+        name   = digest + '.npz'
+        entry  = self.path + os.sep + name
+
+        if os.path.exists(entry):
+            with np.load(entry) as data:
+                if float(data['fitness']) <= fitness:
+                    return False
+
+        # Written into a temporary file first, since several processes can share the library
+        temporary = entry + '.%d.tmp' % os.getpid()
+        with open(temporary, 'wb') as fo:
+            np.savez(fo, hist=hist, genes=genes, fitness=fitness, maxGrayLevel=maxGrayLevel)
+        os.replace(temporary, entry)
+
+        # A replaced entry keeps its position in the index, with the signature of the same histogram
+        if name in self.__loaded:
+            self.__fitness[self.__names.index(name)] = fitness
+        else:
+            self.__names.append(name)
+            self.__loaded.add(name)
+            self.__signatures = np.vstack([self.__signatures, self.signature(hist, maxGrayLevel)])
+            self.__fitness    = np.append(self.__fitness, fitness)
+
+        return True
+
+    # The k solutions nearest to the histogram (signature over the range maxGrayLevel) as a list of (distance, hist, genes, fitness)
+    def nearest(self, hist, maxGrayLevel, k=5):
+
+        if len(self) == 0:
+            return []
+
+        distances = np.mean(np.abs(self.__signatures - self.signature(hist, maxGrayLevel)), axis=1)
+
+        k = min(k, len(self))
+        closest = np.argpartition(distances, k - 1)[:k]
+        closest = closest[np.argsort(distances[closest], kind='stable')]
+
+        solutions = []
+        for index in closest:
+            with np.load(self.path + os.sep + self.__names[index]) as data:
+                solutions.append((float(distances[index]), data['hist'], data['genes'], float(data['fitness'])))
+
+        return solutions
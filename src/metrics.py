@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+from collections import OrderedDict
+
+# Optional: peak memory of the process (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Instrumentation of a run: time spent in each phase of the GA, per-generation records and counters
+# The phases are measured by means of consecutive time stamps, e.g.:
+#   t = metrics.tick()
+#   ... selection ...
+#   t = metrics.add('selection', t)
+class runMetrics(object):
+
+    def __init__(self):
+
+        self.phases      = OrderedDict()
+        self.counters    = OrderedDict()
+        self.generations = []
+
+        self.__start      = time.perf_counter()
+        self.__generation = OrderedDict()
+        self.__lastRecord = self.__start
+
+    def tick(self):
+        return time.perf_counter()
+
+    # Beginning of a generation: the time stamp is returned, as in tick
+    def startGeneration(self):
+
+        self.__generation = OrderedDict()
+        self.__lastRecord = time.perf_counter()
+
+        return self.__lastRecord
+
+    # Adding the time elapsed from start to the phase; the current time stamp is returned
+    def add(self, phase, start):
+
+        now = time.perf_counter()
+
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - start
+        self.__generation[phase] = self.__generation.get(phase, 0.0) + now - start
+
+        return now
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    # Record of a generation: elapsed time since its beginning, fitness evaluations, best fitness and time of each phase
+    def addGeneration(self, generation, evaluations, bestFitness):
+
+        now = time.perf_counter()
+
+        record = OrderedDict([("generation", generation), ("seconds", now - self.__lastRecord),
+                              ("evaluations", int(evaluations)), ("bestFitness", float(bestFitness))])
+        record.update(self.__generation)
+        self.generations.append(record)
+
+        self.__generation = OrderedDict()
+        self.__lastRecord = now
+
+    # Summary of the run, the per-generation records are written into pathOut/metrics.json and pathOut/metrics.csv
+    # source is the image whose GA run produced the results, when they were reused for an image with the same histogram
+    def save(self, pathOut, cacheStatistics=(0, 0), source=None):
+
+        summary = OrderedDict([
+            ("seconds", time.perf_counter() - self.__start),
+            ("generations", len(self.generations)),
+            ("deduplicated", source is not None),
+            ("cacheHits", int(cacheStatistics[0])),
+            ("cacheMisses", int(cacheStatistics[1])),
+            ("peakRSS", peakMemory()),
+            ("bytesWritten", outputBytes(pathOut)),
+        ])
+        summary.update(self.counters)
+
+        record = OrderedDict([("summary", summary), ("phases", self.phases), ("generations", self.generations)])
+        if source is not None:
+            record["source"] = source
+
+        with open(pathOut + os.sep + 'metrics.json', "w") as fo:
+            json.dump(record, fo, indent=2)
+
+        with open(pathOut + os.sep + 'metrics.csv', "w") as fo:
+            columns = ["generation", "seconds", "evaluations", "bestFitness"]
+            columns += [phase for phase in self.phases if any(phase in record for record in self.generations)]
+            fo.write(",".join(columns) + "\n")
+            for record in self.generations:
+                fo.write(",".join(str(record.get(column, 0.0)) for column in columns) + "\n")
+
+# Peak resident set size of the process in bytes (None when it is not available)
+def peakMemory():
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Size of the files written into the output folder of an image (the metrics themselves are not counted)
+def outputBytes(pathOut):
+
+    total = 0
+    for folder, _, files in os.walk(pathOut):
+        for name in files:
+            if name not in ('metrics.json', 'metrics.csv'):
+                total += os.path.getsize(os.path.join(folder, name))
+
+    return total
+
+# Aggregating the metrics of the images processed by a runner into folderOut/metrics.json and folderOut/metrics.csv
+# The images whose results were reused from another image with the same histogram are counted as deduplicated
+def aggregateMetrics(pathsOutput, folderOut):
+
+    images = []
+    for path in pathsOutput:
+        if os.path.exists(path + os.sep + 'metrics.json'):
+            with open(path + os.sep + 'metrics.json') as fi:
+                images.append((path, json.load(fi)))
+
+    if len(images) == 0:
+        return None
+
+    totals = OrderedDict()
+    phases = OrderedDict()
+    for path, metrics in images:
+        for name, value in metrics["summary"].items():
+            if name not in ("peakRSS", "deduplicated") and value is not None:
+                totals[name] = totals.get(name, 0) + value
+        for name, value in metrics["phases"].items():
+            phases[name] = phases.get(name, 0.0) + value
+
+    peaks = [metrics["summary"]["peakRSS"] for path, metrics in images if metrics["summary"]["peakRSS"] is not None]
+    totals["peakRSS"] = max(peaks) if peaks else None
+
+    deduplicated = sum(1 for path, metrics in images if metrics["summary"].get("deduplicated"))
+
+    aggregate = OrderedDict([("images", len(images)), ("gaRuns", len(images) - deduplicated), ("deduplicated", deduplicated),
+                             ("totals", totals), ("phases", phases),
+                             ("perImage", [OrderedDict([("output", path)] + list(metrics["summary"].items())) for path, metrics in images])])
+
+    with open(folderOut + os.sep + 'metrics.json', "w") as fo:
+        json.dump(aggregate, fo, indent=2)
+
+    with open(folderOut + os.sep + 'metrics.csv', "w") as fo:
+        columns = list(images[0][1]["summary"].keys())
+        fo.write(",".join(["output"] + columns) + "\n")
+        for path, metrics in images:
+            fo.write(",".join([path] + [str(metrics["summary"].get(column)) for column in columns]) + "\n")
+
+    return aggregate
@@ -0,0 +1,103 @@
+import numpy as np
+from multiprocessing import Pool, shared_memory
+
+from src.fitness import calculateFitnessBatch
+
+# Parallel evaluation of the fitness of a population by means of a pool of processes
+# The target histogram, the positions of its non-zero bins and the gene matrix to be evaluated are stored
+# in shared memory: the workers attach to them once, so that only row ranges and results are exchanged
+
+# Arrays attached by each worker process
+_shared = {}
+
+def _attach(blocks, maxGrayLevel, sparse):
+
+    for name, (blockName, shape, dtype) in blocks.items():
+        block = shared_memory.SharedMemory(name=blockName)
+        _shared[name + 'Block'] = block
+        _shared[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    _shared['maxGrayLevel'] = maxGrayLevel
+    _shared['sparse']       = sparse
+
+def _evaluateRows(rows):
+
+    start, end = rows
+    return calculateFitnessBatch(_shared['genes'][start:end], _shared['targetHist'], _shared['noZeroPosHist'], _shared['maxGrayLevel'], _shared['sparse'])
+
+# Class evaluating gene matrices of up to capacity rows on a pool of workers
+class parallelEvaluator(object):
+
+    def __init__(self, targetHist, noZeroPosHist, numberOfGenes, maxGrayLevel, capacity, workers, minChunk=8, sparse=False):
+
+        self.workers  = workers
+        self.capacity = capacity
+        self.minChunk = minChunk
+        self.sparse   = sparse
+
+        self.__blocks = []
+        self.__targetHist    = self.__share(np.asarray(targetHist, dtype=np.int64))
+        self.__noZeroPosHist = self.__share(np.asarray(noZeroPosHist, dtype=np.int64))
+        self.__genes         = self.__share(np.zeros((capacity, numberOfGenes), dtype=np.int64))
+        self.__maxGrayLevel  = int(maxGrayLevel)
+
+        descriptors = {
+            'targetHist':    self.__describe(0, self.__targetHist),
+            'noZeroPosHist': self.__describe(1, self.__noZeroPosHist),
+            'genes':         self.__describe(2, self.__genes),
+        }
+
+        self.__pool = Pool(workers, initializer=_attach, initargs=(descriptors, self.__maxGrayLevel, sparse))
+
+    def __share(self, array):
+
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.__blocks.append(block)
+
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+
+        return shared
+
+    def __describe(self, index, array):
+        return self.__blocks[index].name, array.shape, array.dtype.str
+
+    # Fitness values, thresholds and terms of each row of genes (same outputs of calculateFitnessBatch)
+    def evaluate(self, genes):
+
+        genes = np.atleast_2d(genes)
+        n = genes.shape[0]
+
+        # Small batches are not worth the communication with the workers
+        if n < 2*self.minChunk:
+            return calculateFitnessBatch(genes, self.__targetHist, self.__noZeroPosHist, self.__maxGrayLevel, self.sparse)
+
+        fitness = np.empty(n)
+        opt_T   = np.empty(n, dtype=np.int64)
+        terms   = np.empty((n, 3))
+
+        for offset in range(0, n, self.capacity):
+            size = min(self.capacity, n - offset)
+            self.__genes[:size] = genes[offset:offset+size]
+
+            # One contiguous range of rows for each worker
+            chunk  = max(self.minChunk, -(-size // self.workers))
+            ranges = [(start, min(start+chunk, size)) for start in range(0, size, chunk)]
+
+            for (start, end), result in zip(ranges, self.__pool.map(_evaluateRows, ranges)):
+                fitness[offset+start:offset+end] = result[0]
+                opt_T[offset+start:offset+end]   = result[1]
+                terms[offset+start:offset+end]   = result[2]
+
+        return fitness, opt_T, terms
+
+    def close(self):
+
+        self.__pool.close()
+        self.__pool.join()
+
+        self.__targetHist = self.__noZeroPosHist = self.__genes = None
+        for block in self.__blocks:
+            block.close()
+            block.unlink()
+        self.__blocks = []
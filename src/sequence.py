@@ -0,0 +1,46 @@
+from src.enhance import enhance
+
+# Sequence mode of Enhancify: the frames of a time-lapse (or the images of a folder) are enhanced in order, and
+# the population of each frame is seeded with the best mapping of the previous frame (warm start), so that fewer
+# generations are needed. A mapping is reused as it is, without running the GA, on the following frames whose
+# histograms differ from the histogram of the frame where it was evolved by less than reuseDistance (0 disables it)
+
+# Frames of a stack: the pages of a multi-page TIFF image (first axis), otherwise the image itself
+# Colour images (last axis of 3 or 4 channels) are considered single frames
+def readFrames(imagePath):
+
+    from src.imageProcessing import processing
+
+    stack = processing().openImage(imagePath)
+
+    if stack.ndim == 3 and stack.shape[-1] not in (3, 4):
+        return [stack[k] for k in range(len(stack))]
+
+    return [stack]
+
+# Enhancement of the frames (arrays or paths of images) by using the provided GA settings; the results of the frames are returned
+# The first frame evolves for numGen generations, the others for warmGenerations (default: numGen/10)
+# When pathsOutput is provided, the outputs of each frame are saved into the corresponding folder
+# The perturbation of the warm starts and reuseDistance are options of Enhancify.startGA, as the other keyword arguments
+def enhanceSequence(frames, pop_size=100, numGen=100, selection='tournament', cross_rate=0.9, mut_rate=0.01, elitism=1, numberIndTour=20,
+                    warmGenerations=None, traces=False, pathsOutput=None, **options):
+
+    if warmGenerations is None:
+        warmGenerations = max(2, numGen // 10)
+
+    results = []
+    mapping = None
+    for k, frame in enumerate(frames):
+
+        pathOutput = None if pathsOutput is None else pathsOutput[k]
+
+        result = enhance(frame, pop_size, numGen if mapping is None else warmGenerations, selection, cross_rate, mut_rate, elitism, numberIndTour,
+                         traces=traces, pathOutput=pathOutput, **dict(options, initialMapping=mapping))
+
+        # A reused mapping remains anchored to the histogram of the frame where it was evolved
+        if result.reason != "reused mapping":
+            mapping = result.mapping
+
+        results.append(result)
+
+    return results
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import signal
+import threading
+import http.client
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker daemon of Enhancify: a pool of warmed-up processes (modules imported, first run done) enhances the images
+# submitted over HTTP, either on a TCP address (host:port) or on a local Unix socket (unix:/path/to/socket)
+#
+#   POST /jobs    JSON job, e.g. {"path": "image.png", "output": "out/image", "settings": {"numGen": 50, "seed": 1}}
+#                 or {"data": <base64 image file>, "image": true, "lut": true, "traces": true}
+#   GET  /status  workers, capacity and counters of the jobs
+#
+# At most workers+queueSize jobs are admitted at the same time: the others are rejected with 503 (and Retry-After),
+# so that the clients slow down instead of piling up requests in memory
+# The server only reads the images named by its clients, so it should be bound to localhost or to a private socket
+
+# Settings of a job passed as positional arguments of enhance (the other settings are options of Enhancify.startGA)
+jobArguments = ("pop_size", "numGen", "selection", "cross_rate", "mut_rate", "elitism", "numberIndTour")
+
+# Importing the heavy modules and running a tiny GA once, so that the first job does not pay for them
+def warmUp():
+
+    # imageio is only imported here, so that the workers do not pay for its import at the first job
+    import imageio  # noqa: F401
+    import numpy as np
+    from src.enhance import enhance
+
+    enhance(np.tile(np.arange(1, 17, dtype=np.uint8), (16, 1)), 4, 2, cacheSize=0)
+
+# Job executed by a worker process: the image is either a path or the base64-encoded content of an image file
+def runJob(job, defaults):
+
+    import imageio
+    from src.enhance import enhance
+
+    settings = dict(defaults)
+    settings.update(job.get("settings", {}))
+
+    if "data" in job:
+        image = imageio.imread(base64.b64decode(job["data"]))
+    elif "path" in job:
+        image = job["path"]
+    else:
+        raise ValueError("A job requires either the path or the data of an image")
+
+    start = time.time()
+
+    arguments = [settings.pop(name) for name in jobArguments]
+    result = enhance(image, *arguments, traces=bool(job.get("traces")), pathOutput=job.get("output"), **settings)
+
+    response = {"fitness": result.fitness, "threshold": result.threshold, "reason": result.reason,
+                "cacheStatistics": list(result.cacheStatistics), "output": job.get("output")}
+
+    if job.get("lut"):
+        response["lut"] = result.lut.tolist()
+    if job.get("traces"):
+        response["traces"] = {name: values.tolist() for name, values in result.traces.items()}
+    if job.get("image"):
+        response["image"] = base64.b64encode(imageio.imwrite("<bytes>", result.image, format="png")).decode("ascii")
+
+    response["elapsed"] = time.time() - start
+
+    return response
+
+# HTTP server on a Unix socket (the address of the clients is an empty string)
+class unixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+class jobHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        if self.path != "/status":
+            return self.__reply(404, {"error": "unknown resource " + self.path})
+
+        self.__reply(200, self.server.owner.status())
+
+    def do_POST(self):
+
+        if self.path != "/jobs":
+            return self.__reply(404, {"error": "unknown resource " + self.path})
+
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            return self.__reply(400, {"error": "the job is not valid JSON"})
+
+        code, response = self.server.owner.submit(job)
+        self.__reply(code, response)
+
+    def __reply(self, code, response):
+
+        body = json.dumps(response).encode()
+
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if code == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.owner.verbose:
+            print(" * " + format % args)
+
+# Daemon accepting the jobs and running them on the pool of processes
+class enhancementServer(object):
+
+    def __init__(self, address, defaults, workers=1, queueSize=16, verbose=False):
+
+        self.address  = address
+        self.workers  = workers
+        self.capacity = workers + queueSize
+        self.verbose  = verbose
+
+        self.__defaults = defaults
+        self.__slots    = threading.BoundedSemaphore(self.capacity)
+        self.__lock     = threading.Lock()
+        self.__counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+        self.__executor = self.__startPool()
+
+        if address.startswith("unix:"):
+            path = address[len("unix:"):]
+            if os.path.exists(path):
+                os.remove(path)
+            self.__httpd = unixHTTPServer(path, jobHandler)
+        else:
+            host, port = address.rsplit(":", 1)
+            self.__httpd = ThreadingHTTPServer((host, int(port)), jobHandler)
+            self.address = "%s:%d" % self.__httpd.server_address[:2]
+
+        self.__httpd.owner = self
+
+    # Pool of processes, all of them started and warmed up before the first job
+    def __startPool(self):
+
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warmUp)
+        wait([executor.submit(int) for k in range(self.workers)])
+
+        return executor
+
+    def __count(self, name):
+        with self.__lock:
+            self.__counters[name] += 1
+
+    # Running a job; the HTTP status code and the response are returned
+    def submit(self, job):
+
+        # Backpressure: the job is rejected when all the slots (running and queued jobs) are taken
+        if not self.__slots.acquire(blocking=False):
+            self.__count("rejected")
+            return 503, {"error": "the queue is full"}
+
+        self.__count("submitted")
+        try:
+            executor = self.__executor
+            response = executor.submit(runJob, job, self.__defaults).result()
+            self.__count("completed")
+            return 200, response
+
+        except (ValueError, KeyError, TypeError, FileNotFoundError) as error:
+            self.__count("failed")
+            return 400, {"error": str(error)}
+
+        except BrokenProcessPool:
+            # A worker died (e.g., out of memory): the pool is replaced for the next jobs
+            self.__count("failed")
+            with self.__lock:
+                if self.__executor is executor:
+                    self.__executor = self.__startPool()
+            return 500, {"error": "a worker terminated unexpectedly"}
+
+        except Exception as error:
+            self.__count("failed")
+            return 500, {"error": repr(error)}
+
+        finally:
+            self.__slots.release()
+
+    def status(self):
+
+        with self.__lock:
+            status = dict(self.__counters)
+
+        status.update({"address": self.address, "workers": self.workers, "capacity": self.capacity,
+                       "active": status["submitted"] - status["completed"] - status["failed"]})
+
+        return status
+
+    # Serving until SIGINT or SIGTERM
+    def serveForever(self):
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        try:
+            self.__httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+
+        self.__httpd.server_close()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+        if self.address.startswith("unix:") and os.path.exists(self.address[len("unix:"):]):
+            os.remove(self.address[len("unix:"):])
+
+# HTTP connection on a Unix socket
+class unixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.__path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.__path)
+
+# Client of the daemon: the HTTP status code and the JSON response are returned (job None requests the status)
+def request(address, job=None, timeout=None):
+
+    if address.startswith("unix:"):
+        connection = unixHTTPConnection(address[len("unix:"):], timeout)
+    else:
+        host, port = address.rsplit(":", 1)
+        connection = http.client.HTTPConnection(host, int(port), timeout=timeout)
+
+    try:
+        if job is None:
+            connection.request("GET", "/status")
+        else:
+            connection.request("POST", "/jobs", json.dumps(job), {"Content-Type": "application/json"})
+
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
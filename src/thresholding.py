@@ -0,0 +1,150 @@
+import numpy as np
+import math
+
+# Efficient Iterative Optimal Threshold Selection (IOTS) algorithm
+# The cumulative count and the cumulative weighted sum of the histogram are built once,
+# so that each iteration only needs a constant number of lookups
+
+# Cumulative arrays of the histogram(s) along the last axis: C[k] = sum(h[0:k]), S[k] = sum(h[i]*(i-1), i<k)
+def cumulativeHistogram(hist_vals):
+
+    hist_vals = np.asarray(hist_vals)
+    weights = np.arange(hist_vals.shape[-1]) - 1
+
+    pad = [(0, 0)] * (hist_vals.ndim - 1) + [(1, 0)]
+    counts = np.pad(np.cumsum(hist_vals, axis=-1), pad)
+    weightedSums = np.pad(np.cumsum(hist_vals * weights, axis=-1), pad)
+
+    return counts, weightedSums
+
+# IOTS on a single histogram. It returns the threshold and the mean values of the two sub-histograms
+def optimalThreshold(hist_vals, delta_T, max_it):
+
+    counts, weightedSums = cumulativeHistogram(hist_vals)
+    h_dim = len(counts) - 1
+
+    total_pixel_number = counts[h_dim]
+    weighted_hist_sum  = weightedSums[h_dim]
+
+    # Initializing the threshold to the global mean
+    hist_mean = weighted_hist_sum / (total_pixel_number*1.0)
+
+    # If the histogram mean is equal to 0, the procedure ends
+    if hist_mean == 0:
+        return 1, float('nan'), float('nan')
+
+    H1_mean = float('nan')
+    H2_mean = float('nan')
+
+    # Threshold at step k
+    T_k = 0
+
+    # Threshold at step k+1
+    T_k1 = int(math.floor(hist_mean))
+
+    # Iteration counter
+    counter = 1
+
+    while counter < max_it:
+        if (T_k1 - T_k) <= delta_T:
+            break
+
+        # Updating the threshold
+        T_k = T_k1
+
+        # Splitting the histogram H into two sub-histograms H1 = H[0:T_k] and H2 = H[T_k+1:]
+        low  = min(max(T_k, 0), h_dim)
+        high = min(max(T_k+1, 0), h_dim)
+
+        H1_pixel_number = counts[low]
+        H2_pixel_number = total_pixel_number - counts[high]
+
+        weighted_H1_sum = weightedSums[low]
+        weighted_H2_sum = weighted_hist_sum - weightedSums[high]
+
+        # Mean values of the sub-histograms H1 and H2
+        H1_mean = weighted_H1_sum / (H1_pixel_number*1.0)
+        H2_mean = weighted_H2_sum / (H2_pixel_number*1.0)
+
+        # Updating the threshold at step k+1 (T_k1)
+        T_k1 = int(math.floor((H1_mean + H2_mean) / 2.0))
+        counter = counter + 1
+
+    return T_k, H1_mean, H2_mean
+
+# IOTS on a matrix of histograms (one histogram for each row), all the rows are processed at once
+def optimalThresholdBatch(hists, delta_T, max_it):
+
+    counts, weightedSums = cumulativeHistogram(hists)
+    n, h_dim = counts.shape[0], counts.shape[1] - 1
+    rows = np.arange(n)
+
+    # Occurrences and weighted sum of the bins below each threshold
+    def below(T):
+        T = np.clip(T, 0, h_dim)
+        return counts[rows, T], weightedSums[rows, T]
+
+    return iterativeThreshold(below, counts[:, h_dim], weightedSums[:, h_dim], delta_T, max_it)
+
+# IOTS on sparse histograms: each row contains the sorted gray levels of the non-zero bins (possibly repeated)
+# and weights contains their occurrences, so that the cost depends on the number of non-zero bins only
+# h_dim is the number of gray levels of the corresponding dense histograms
+def optimalThresholdSparse(levels, weights, h_dim, delta_T, max_it):
+
+    levels  = np.atleast_2d(levels)
+    weights = np.broadcast_to(weights, levels.shape)
+    n, k = levels.shape
+
+    pad = [(0, 0), (1, 0)]
+    counts = np.pad(np.cumsum(weights, axis=1), pad)
+    weightedSums = np.pad(np.cumsum(weights * (levels - 1), axis=1), pad)
+
+    # The rows are shifted by h_dim+1 gray levels, so that a single search finds the bins below the thresholds of all the rows
+    offsets = np.arange(n) * (h_dim + 1)
+    shifted = (levels + offsets.reshape(-1, 1)).ravel()
+    rows = np.arange(n)
+
+    def below(T):
+        index = np.searchsorted(shifted, np.clip(T, 0, h_dim) + offsets) - rows * k
+        return counts[rows, index], weightedSums[rows, index]
+
+    return iterativeThreshold(below, counts[:, k], weightedSums[:, k], delta_T, max_it)
+
+# Iterations of IOTS on n histograms, where below(T) returns the occurrences and the weighted sums of the bins below the thresholds T
+def iterativeThreshold(below, total_pixel_number, weighted_hist_sum, delta_T, max_it):
+
+    n = len(total_pixel_number)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hist_mean = weighted_hist_sum / (total_pixel_number*1.0)
+
+        H1_mean = np.full(n, np.nan)
+        H2_mean = np.full(n, np.nan)
+
+        T_k  = np.zeros(n, dtype=np.int64)
+        T_k1 = np.floor(np.nan_to_num(hist_mean)).astype(np.int64)
+
+        # The rows having a histogram mean equal to 0 are not processed
+        active = hist_mean != 0
+
+        for counter in range(1, max_it):
+            active &= (T_k1 - T_k) > delta_T
+            if not np.any(active):
+                break
+
+            T_k = np.where(active, T_k1, T_k)
+
+            H1_pixel_number, weighted_H1_sum = below(T_k)
+            counts_high, weighted_high = below(T_k+1)
+
+            H2_pixel_number = total_pixel_number - counts_high
+            weighted_H2_sum = weighted_hist_sum - weighted_high
+
+            H1_mean = np.where(active, weighted_H1_sum / (H1_pixel_number*1.0), H1_mean)
+            H2_mean = np.where(active, weighted_H2_sum / (H2_pixel_number*1.0), H2_mean)
+
+            T_k1 = np.where(active, np.floor((H1_mean + H2_mean) / 2.0).astype(np.int64), T_k1)
+
+    T_k[hist_mean == 0] = 1
+
+    return T_k, H1_mean, H2_mean
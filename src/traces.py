@@ -0,0 +1,88 @@
+import os
+import numpy as np
+
+# Class collecting the per-generation records of a run (fitness, threshold and terms of the best individual)
+# The records are kept in memory and written every flushInterval generations (0: only when the writer is closed),
+# either as the text files fitness, threshold and terms, as a compact trace.npz file, or both
+# When pathOut is None, the records are only kept in memory
+class traceWriter(object):
+
+    def __init__(self, pathOut, flushInterval=100, traceFormat='text'):
+
+        self.flushInterval = flushInterval
+        self.traceFormat   = traceFormat
+
+        self.__pathOut          = pathOut
+        self.__outputNameFit    = None if pathOut is None else pathOut + os.sep + "fitness"
+        self.__outputNameThresh = None if pathOut is None else pathOut + os.sep + "threshold"
+        self.__outputNameTerms  = None if pathOut is None else pathOut + os.sep + "terms"
+        self.__outputNameTrace  = None if pathOut is None else pathOut + os.sep + "trace.npz"
+
+        self.__fitness   = []
+        self.__threshold = []
+        self.__terms     = []
+
+        # Number of records already written into the text files
+        self.__written = 0
+
+    def __len__(self):
+        return len(self.__fitness)
+
+    def append(self, fitness, opt_T, terms):
+
+        self.__fitness.append(float(fitness))
+        self.__threshold.append(int(opt_T))
+        self.__terms.append([float(term) for term in terms])
+
+        if self.flushInterval > 0 and len(self) - self.__written >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+
+        if self.__pathOut is None:
+            self.__written = len(self)
+            return
+
+        if self.traceFormat in ('text', 'both'):
+            self.__flushText()
+
+        if self.traceFormat in ('npz', 'both'):
+            fitness, threshold, terms = self.getRecords()
+            np.savez(self.__outputNameTrace, fitness=fitness, threshold=threshold, terms=terms)
+
+        self.__written = len(self)
+
+    def __flushText(self):
+
+        # The text files are rewritten at the first flush and extended afterwards
+        mod = "w" if self.__written == 0 else "a"
+        new = slice(self.__written, len(self))
+
+        with open(self.__outputNameFit, mod) as fo:
+            for fitness in self.__fitness[new]:
+                fo.write(str(fitness) + "\n")
+
+        with open(self.__outputNameThresh, mod) as fo:
+            for opt_T in self.__threshold[new]:
+                fo.write(str(opt_T) + "\n")
+
+        with open(self.__outputNameTerms, mod) as fo:
+            for term1, term2, term3 in self.__terms[new]:
+                fo.write(str(term1) + "\t" + str(term2) + "\t" + str(term3) + "\n")
+
+    # Replacing the records with the ones of a previous run (e.g., restored from a checkpoint);
+    # the files are rewritten at the next flush
+    def restore(self, fitness, threshold, terms):
+
+        self.__fitness   = [float(value) for value in fitness]
+        self.__threshold = [int(value) for value in threshold]
+        self.__terms     = [[float(term) for term in row] for row in terms]
+
+        self.__written = 0
+
+    def close(self):
+        self.flush()
+
+    # All the records as arrays: fitness values, thresholds and terms (one row for each generation)
+    def getRecords(self):
+        return np.array(self.__fitness), np.array(self.__threshold, dtype=np.int64), np.array(self.__terms).reshape(-1, 3)
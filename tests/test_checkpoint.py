@@ -0,0 +1,53 @@
+import os
+import imageio
+import numpy as np
+import pytest
+
+import src.Enhancify_sequential as sequential
+from src.Enhancify_sequential import Enhancify
+
+# Small bimodal 8-bit image
+def bimodalImage(path):
+
+    rng = np.random.default_rng(0)
+    pixels = np.concatenate([rng.normal(70, 10, 2048), rng.normal(180, 15, 2048)])
+    imageio.imwrite(path, np.clip(pixels, 1, 255).astype(np.uint8).reshape(64, 64))
+
+def runGA(pathIn, pathOut, **options):
+
+    Enhancify(pathIn, pathOut).startGA(20, 30, 'tournament', 0.9, 0.01, 1, 5, options=dict(options, seed=3, checkpointInterval=5))
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path, monkeypatch, capsys):
+
+    pathIn = str(tmp_path / 'image.png')
+    bimodalImage(pathIn)
+
+    runGA(pathIn, str(tmp_path / 'reference'))
+
+    # Interrupting the run when the second checkpoint is saved (generation 10)
+    saveCheckpoint = sequential.saveCheckpoint
+    calls = []
+    def interruptedSave(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        saveCheckpoint(*args)
+
+    monkeypatch.setattr(sequential, 'saveCheckpoint', interruptedSave)
+    with pytest.raises(KeyboardInterrupt):
+        runGA(pathIn, str(tmp_path / 'resumed'))
+    monkeypatch.setattr(sequential, 'saveCheckpoint', saveCheckpoint)
+    assert os.path.exists(tmp_path / 'resumed' / 'checkpoint.npz')
+
+    capsys.readouterr()
+    runGA(pathIn, str(tmp_path / 'resumed'), resume=True)
+    assert 'no valid checkpoint' not in capsys.readouterr().out
+
+    for name in ['fitness', 'threshold', 'terms', 'matrixBest']:
+        with open(tmp_path / 'reference' / name, 'rb') as fr, open(tmp_path / 'resumed' / name, 'rb') as fo:
+            assert fr.read() == fo.read(), name
+
+    reference = np.loadtxt(tmp_path / 'reference' / 'fitness')
+    resumed   = np.loadtxt(tmp_path / 'resumed' / 'fitness')
+    assert len(resumed) == 30 and resumed[-1] == reference[-1]
+    assert not os.path.exists(tmp_path / 'resumed' / 'checkpoint.npz')
@@ -0,0 +1,105 @@
+import math
+import numpy as np
+
+from src.GA import population
+from src.fitness import calculateFitnessBatch, calculateFitnessCached, fitnessCache
+from src.thresholding import optimalThreshold
+
+# Bimodal histogram of an 8-bit image and its non-zero bins
+def targetHistogram(seed=0):
+
+    rng = np.random.default_rng(seed)
+    pixels = np.concatenate([rng.normal(0.3, 0.05, 3000), rng.normal(0.7, 0.07, 2000)])
+
+    hist = np.bincount(np.clip(np.rint(pixels * 255), 1, 255).astype(np.int64), minlength=256)
+
+    return hist, list(np.nonzero(hist)[0])
+
+# Fitness of a single individual computed with explicit loops, as in the original per-chromosome implementation
+def referenceFitness(genes, targetHist, noZeroPosHist, maxGrayLevel):
+
+    hist = np.zeros(maxGrayLevel + 1, dtype=np.int64)
+    for gene, position in zip(genes, noZeroPosHist):
+        hist[gene] += targetHist[position]
+
+    opt_T, mu1, mu2 = optimalThreshold(hist, 0.001, 100)
+
+    levels = np.nonzero(hist)[0]
+    val1 = val2 = levels[0]
+    pos = 0
+    for i in range(1, len(levels)):
+        if levels[i] <= opt_T:
+            val2, pos = levels[i], i
+        else:
+            break
+    val3, val4 = levels[pos+1], levels[-1]
+
+    countOcc1 = acc1 = countOcc2 = acc2 = 0
+    for level in levels:
+        if level <= opt_T:
+            countOcc1 += hist[level]
+            acc1 += hist[level] * (level - mu1)**2
+        else:
+            countOcc2 += hist[level]
+            acc2 += hist[level] * (level - mu2)**2
+
+    sigma1, sigma2 = math.sqrt(acc1 / float(countOcc1)), math.sqrt(acc2 / float(countOcc2))
+
+    return abs(2*opt_T - mu1 - mu2) + abs((val2 - val1) / 2.0 * 0.33 - sigma1) + abs((val4 - val3) / 2.0 * 0.33 - sigma2)
+
+# Random population of sorted genes (several genes can share the same gray level)
+def randomPopulation(targetHist, noZeroPosHist, size=30, seed=0):
+
+    pop = population(targetHist, noZeroPosHist, len(noZeroPosHist), 1, 255, size)
+    pop.initialize(np.random.default_rng(seed))
+
+    return pop
+
+def test_batch_fitness_matches_reference():
+
+    targetHist, noZeroPosHist = targetHistogram()
+    pop = randomPopulation(targetHist, noZeroPosHist)
+
+    fitness, _, terms = calculateFitnessBatch(pop.genes, targetHist, noZeroPosHist, 255)
+
+    for k in range(len(pop)):
+        assert np.isclose(fitness[k], referenceFitness(pop.genes[k], targetHist, noZeroPosHist, 255))
+    assert np.allclose(np.sum(terms, axis=1), fitness)
+
+def test_sparse_fitness_matches_dense_fitness():
+
+    targetHist, noZeroPosHist = targetHistogram(seed=1)
+    pop = randomPopulation(targetHist, noZeroPosHist, seed=1)
+
+    dense  = calculateFitnessBatch(pop.genes, targetHist, noZeroPosHist, 255)
+    sparse = calculateFitnessBatch(pop.genes, targetHist, noZeroPosHist, 255, sparse=True)
+
+    assert np.allclose(dense[0], sparse[0])
+    assert np.array_equal(dense[1], sparse[1])
+    assert np.allclose(dense[2], sparse[2])
+
+def test_population_fitness_matches_chromosomes():
+
+    targetHist, noZeroPosHist = targetHistogram(seed=2)
+    pop = randomPopulation(targetHist, noZeroPosHist, seed=2)
+    pop.evaluate()
+
+    for k in range(len(pop)):
+        fitness, opt_T, _ = pop.getChromosome(k).calculateFitness(targetHist, noZeroPosHist, 255, 1)
+
+        assert np.isclose(pop.fitness[k], fitness) and pop.opt_T[k] == opt_T
+
+def test_cached_fitness_matches_batch_fitness():
+
+    targetHist, noZeroPosHist = targetHistogram(seed=3)
+    pop = randomPopulation(targetHist, noZeroPosHist, seed=3)
+
+    # The second half repeats the first one, so that its fitness values come from the cache
+    genes = np.concatenate([pop.genes, pop.genes])
+    cache = fitnessCache(100)
+
+    fitness, opt_T, _ = calculateFitnessCached(genes, targetHist, noZeroPosHist, 255, cache)
+    expected, expected_T, _ = calculateFitnessBatch(genes, targetHist, noZeroPosHist, 255)
+
+    assert np.allclose(fitness, expected) and np.array_equal(opt_T, expected_T)
+    assert cache.hits >= len(pop)
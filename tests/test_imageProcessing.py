@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from src.imageProcessing import processing
+
+def bimodalHistogram(seed=0):
+
+    rng = np.random.default_rng(seed)
+    pixels = np.concatenate([rng.normal(0.3, 0.05, 3000), rng.normal(0.7, 0.07, 2000)])
+
+    return np.bincount(np.clip(np.rint(pixels * 255), 1, 255).astype(np.int64), minlength=256)
+
+def test_transfer_mapping_on_identical_histogram_returns_genes():
+
+    hist = bimodalHistogram()
+    numberOfGenes = len(np.nonzero(hist)[0])
+    genes = np.sort(np.random.default_rng(1).integers(1, 256, numberOfGenes))
+
+    transferred = processing().transferMapping(hist, genes, hist.copy(), 1, 255)
+
+    assert np.array_equal(transferred, genes)
+
+def test_transfer_mapping_to_shifted_histogram_is_sorted_and_bounded():
+
+    hist = bimodalHistogram()
+    shifted = np.roll(hist, 10)
+    genes = np.sort(np.random.default_rng(2).integers(1, 256, len(np.nonzero(hist)[0])))
+
+    transferred = processing().transferMapping(hist, genes, shifted, 1, 255)
+
+    assert len(transferred) == len(np.nonzero(shifted)[0])
+    assert np.all(np.diff(transferred) >= 0)
+    assert transferred.min() >= 1 and transferred.max() <= 255
+
+def test_histogram_rejects_negative_gray_levels():
+
+    image = np.array([[-3, 10], [20, 30]], dtype=np.int16)
+
+    with pytest.raises(ValueError):
+        processing().calculateHistogram(image)
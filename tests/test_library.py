@@ -0,0 +1,40 @@
+import os
+import numpy as np
+
+from src.enhance import enhance
+from src.library import openLibrary
+
+# Bimodal image whose largest gray level is maxLevel (the same acquisition with a slightly different range)
+def similarImage(maxLevel, seed=0):
+
+    rng = np.random.default_rng(seed)
+    pixels = np.concatenate([rng.normal(0.3, 0.05, 2000), rng.normal(0.7, 0.08, 2000)])
+    levels = np.clip(np.rint(pixels * maxLevel), 1, maxLevel).astype(np.uint8)
+    levels[0] = maxLevel
+
+    return levels.reshape(40, 100)
+
+def test_nearest_matches_histograms_with_different_largest_levels(tmp_path):
+
+    library = openLibrary(str(tmp_path / "library"))
+
+    first, other = similarImage(232), similarImage(237, seed=1)
+    histFirst, histOther = np.bincount(first.reshape(-1)), np.bincount(other.reshape(-1))
+    histFirst[0] = histOther[0] = 0
+
+    library.add(histFirst, np.arange(1, np.count_nonzero(histFirst) + 1), 0.5, 255)
+
+    solutions = library.nearest(histOther, 255, 5)
+
+    assert len(solutions) == 1
+    assert solutions[0][0] < 0.05
+
+def test_library_seeds_image_with_different_largest_level(tmp_path):
+
+    path = str(tmp_path / "library")
+
+    enhance(similarImage(232), 10, 3, seed=1, library=path)
+    enhance(similarImage(237, seed=1), 10, 3, seed=1, library=path, pathOutput=str(tmp_path / "out"))
+
+    with open(str(tmp_path / "out" / "information")) as fi:
+        assert "Library seeds: 1" in fi.read()
@@ -0,0 +1,83 @@
+import math
+import numpy as np
+
+from src.thresholding import optimalThreshold, optimalThresholdBatch, optimalThresholdSparse
+
+# IOTS computed with explicit loops over the gray levels, as in the original implementation
+def referenceThreshold(hist_vals, delta_T, max_it):
+
+    h_dim = len(hist_vals)
+    total_pixel_number = np.sum(hist_vals)
+    weighted_hist_sum = sum(hist_vals[i] * (i-1) for i in range(h_dim))
+
+    hist_mean = weighted_hist_sum / (total_pixel_number*1.0)
+    if hist_mean == 0:
+        return 1, float('nan'), float('nan')
+
+    H1_mean = H2_mean = float('nan')
+    T_k, T_k1 = 0, int(math.floor(hist_mean))
+
+    counter = 1
+    while counter < max_it:
+        if (T_k1 - T_k) <= delta_T:
+            break
+
+        T_k = T_k1
+
+        H1_pixel_number = sum(hist_vals[i] for i in range(0, T_k))
+        H2_pixel_number = sum(hist_vals[i] for i in range(T_k+1, h_dim))
+        weighted_H1_sum = sum(hist_vals[i] * (i-1) for i in range(0, T_k))
+        weighted_H2_sum = sum(hist_vals[i] * (i-1) for i in range(T_k+1, h_dim))
+
+        H1_mean = weighted_H1_sum / (H1_pixel_number*1.0)
+        H2_mean = weighted_H2_sum / (H2_pixel_number*1.0)
+
+        T_k1 = int(math.floor((H1_mean + H2_mean) / 2.0))
+        counter = counter + 1
+
+    return T_k, H1_mean, H2_mean
+
+# Random bimodal histograms of 8-bit images (background level 0 excluded)
+def bimodalHistograms(count, levels=256, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    hists = np.zeros((count, levels), dtype=np.int64)
+    for k in range(count):
+        low, high = rng.uniform(0.15, 0.45), rng.uniform(0.55, 0.85)
+        pixels = np.concatenate([rng.normal(low, 0.05, 3000), rng.normal(high, 0.07, 2000)])
+        hists[k] = np.bincount(np.clip(np.rint(pixels * (levels - 1)), 1, levels - 1).astype(np.int64), minlength=levels)
+
+    return hists
+
+def test_optimal_threshold_matches_reference():
+
+    for hist in bimodalHistograms(10):
+        T, mu1, mu2 = optimalThreshold(hist, 0.001, 100)
+        T_ref, mu1_ref, mu2_ref = referenceThreshold(hist, 0.001, 100)
+
+        assert T == T_ref
+        assert np.isclose(mu1, mu1_ref) and np.isclose(mu2, mu2_ref)
+
+def test_batch_threshold_matches_single_histograms():
+
+    hists = bimodalHistograms(10, seed=1)
+
+    T, mu1, mu2 = optimalThresholdBatch(hists, 0.001, 100)
+
+    for k, hist in enumerate(hists):
+        T_k, mu1_k, mu2_k = optimalThreshold(hist, 0.001, 100)
+
+        assert T[k] == T_k
+        assert np.isclose(mu1[k], mu1_k) and np.isclose(mu2[k], mu2_k)
+
+def test_sparse_threshold_matches_single_histograms():
+
+    for hist in bimodalHistograms(10, seed=2):
+        levels = np.nonzero(hist)[0]
+
+        T, mu1, mu2 = optimalThresholdSparse(levels, hist[levels], len(hist), 0.001, 100)
+        T_ref, mu1_ref, mu2_ref = optimalThreshold(hist, 0.001, 100)
+
+        assert T[0] == T_ref
+        assert np.isclose(mu1[0], mu1_ref) and np.isclose(mu2[0], mu2_ref)